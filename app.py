@@ -1,14 +1,26 @@
 import streamlit as st
+import io
 import os
+import logging
+import shutil
 import tempfile
+import itertools
+import multiprocessing
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from typing import Dict, Any
 import constants
-from ingest import DocumentIngester
+from ingest import DocumentIngester, process_pdf_worker
 from vector_store import VectorStore
 from graph import AnalystGPTAgent
+from cache.semantic_cache import SemanticCache
 from exports.excel_export import ExcelExporter
 from exports.pdf_export import PDFExporter
 
+# DEBUG=1 turns on debug logging, including in ingestion worker processes
+LOG_LEVEL = logging.DEBUG if os.getenv("DEBUG") else logging.INFO
+logging.basicConfig(level=LOG_LEVEL)
+
 # Page configuration
 st.set_page_config(
     page_title="AnalystGPT - Financial Document Analysis",
@@ -62,20 +74,148 @@ if 'agent' not in st.session_state:
 if 'documents_loaded' not in st.session_state:
     st.session_state.documents_loaded = False
 
+@st.cache_resource
+def get_config() -> constants.Config:
+    """Load and validate the environment configuration once per process."""
+    return constants.load_config()
+
+@st.cache_resource
+def get_vector_store() -> VectorStore:
+    """Create the vector store once per process and share it across sessions."""
+    return VectorStore(get_config().vector_db_path)
+
+@st.cache_resource
+def get_agent(_vector_store: VectorStore) -> AnalystGPTAgent:
+    """Create the agent once per process (the vector store is not hashed)."""
+    return AnalystGPTAgent(_vector_store)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_available_companies(_agent: AnalystGPTAgent):
+    """Companies in the store, memoized so reruns do not rescan the index."""
+    return _agent.get_available_companies()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_available_quarters(_agent: AnalystGPTAgent):
+    """Quarters in the store, memoized so reruns do not rescan the index."""
+    return _agent.get_available_quarters()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_store_stats(_agent: AnalystGPTAgent):
+    """Vector store statistics, memoized alongside the company/quarter lists."""
+    return _agent.get_store_stats()
+
+def clear_store_caches():
+    """Invalidate memoized store metadata after documents are added."""
+    get_available_companies.clear()
+    get_available_quarters.clear()
+    get_store_stats.clear()
+
+@st.cache_resource
+def get_semantic_cache() -> SemanticCache:
+    """Shared semantic cache of analysis results, embedded with the store's model."""
+    return SemanticCache(get_vector_store().embed_query)
+
+def run_cached_analysis(analysis_type: str, on_token=None, **params) -> Dict[str, Any]:
+    """Run an analysis through the semantic cache.
+    
+    on_token, if given, receives the response text as it streams on a cache miss.
+    """
+    cache = get_semantic_cache()
+    params_key = (analysis_type,) + tuple(sorted(
+        (key, value) for key, value in params.items() if key != "question"
+    ))
+    
+    cached, embedding = cache.lookup(params_key, params.get("question"))
+    if cached is not None:
+        return cached
+    
+    result = st.session_state.agent.run_analysis(analysis_type, on_token=on_token, **params)
+    # A question whose embedding failed has nothing to match on later
+    cacheable = embedding is not None or not params.get("question")
+    if cacheable and result.get("status") == "success" and "error" not in result.get("result", {}):
+        cache.set(params_key, result, embedding)
+    return result
+
+def stream_to(placeholder):
+    """on_token callback that renders the streamed response into a placeholder."""
+    parts = []
+    
+    def on_token(token: str):
+        parts.append(token)
+        placeholder.markdown("".join(parts))
+    
+    return on_token
+
+@st.cache_resource
+def get_ingester() -> DocumentIngester:
+    """Shared document ingester for in-process ingestion."""
+    return DocumentIngester()
+
+@st.cache_resource
+def get_excel_exporter() -> ExcelExporter:
+    """Shared Excel exporter instance."""
+    return ExcelExporter()
+
+@st.cache_resource
+def get_pdf_exporter() -> PDFExporter:
+    """Shared PDF exporter instance."""
+    return PDFExporter()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def export_excel_bytes(result: Dict[str, Any], analysis_type: str) -> bytes:
+    """Excel export of a result, rendered once per result rather than on every rerun."""
+    return get_excel_exporter().export_to_buffer(result, analysis_type, io.BytesIO()).getvalue()
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def export_pdf_bytes(result: Dict[str, Any], analysis_type: str) -> bytes:
+    """PDF export of a result, rendered once per result rather than on every rerun."""
+    return get_pdf_exporter().export_analysis_result_bytes(result, analysis_type)
+
 def initialize_system():
     """Initialize the vector store and agent."""
     try:
-        if st.session_state.vector_store is None:
-            st.session_state.vector_store = VectorStore()
-        
-        if st.session_state.agent is None:
-            st.session_state.agent = AnalystGPTAgent(st.session_state.vector_store)
+        st.session_state.vector_store = get_vector_store()
+        st.session_state.agent = get_agent(st.session_state.vector_store)
         
         return True
     except Exception as e:
         st.error(f"Error initializing system: {str(e)}")
         return False
 
+def process_files(file_paths):
+    """Ingest PDFs in parallel, one worker process per file up to the CPU count."""
+    if len(file_paths) <= 1:
+        return [process_pdf_worker(file_path, get_ingester()) for file_path in file_paths]
+    
+    max_workers = min(len(file_paths), os.cpu_count() or 1)
+    # Spawn rather than fork: the parent already holds gRPC clients for Gemini
+    with ProcessPoolExecutor(max_workers=max_workers,
+                             mp_context=multiprocessing.get_context("spawn"),
+                             initializer=partial(logging.basicConfig, level=LOG_LEVEL)) as executor:
+        return list(executor.map(process_pdf_worker, file_paths))
+
+def add_chunks_to_store(vector_store: VectorStore, chunks) -> int:
+    """Embed chunks in concurrent batches and add them to the vector store."""
+    batch_size = constants.EMBEDDING_BATCH_SIZE
+    batches = [chunks[i:i + batch_size] for i in range(0, len(chunks), batch_size)]
+    if not batches:
+        return 0
+    
+    progress = st.progress(0.0, text="Embedding chunks...")
+    unsaved = 0
+    with ThreadPoolExecutor(max_workers=constants.EMBEDDING_WORKERS) as executor:
+        futures = [executor.submit(vector_store.add_documents_batch, batch) for batch in batches]
+        for done, future in enumerate(as_completed(futures), 1):
+            unsaved += future.result()
+            # Save periodically so a long upload is not lost if it fails partway
+            if unsaved >= constants.FLUSH_EVERY_DOCUMENTS:
+                vector_store.flush()
+                unsaved = 0
+            progress.progress(done / len(batches), text=f"Embedded {done}/{len(batches)} batches")
+    
+    vector_store.flush()
+    return len(chunks)
+
 def upload_and_process_documents():
     """Handle document upload and processing."""
     st.header("📁 Document Upload")
@@ -101,30 +241,42 @@ def upload_and_process_documents():
                         file_paths = []
                         for uploaded_file in uploaded_files:
                             file_path = os.path.join(temp_dir, uploaded_file.name)
+                            uploaded_file.seek(0)
                             with open(file_path, "wb") as f:
-                                f.write(uploaded_file.getvalue())
+                                shutil.copyfileobj(uploaded_file, f, length=1 << 20)
                             file_paths.append(file_path)
                         
                         # Process documents
-                        ingester = DocumentIngester()
-                        all_chunks = []
+                        results = process_files(file_paths)
                         
-                        for file_path in file_paths:
-                            chunks = ingester.process_pdf(file_path)
-                            if not chunks:
-                                st.warning(f"No chunks extracted from {file_path} pdf might be empty")
-                                continue
-                            all_chunks.extend(chunks)
+                        for status in results:
+                            file_name = os.path.basename(status["file_path"])
+                            if status["error"]:
+                                st.error(f"Error processing {file_name}: {status['error']}")
+                            elif not status["chunks"]:
+                                st.warning(f"No chunks extracted from {file_name} pdf might be empty")
+                        
+                        all_chunks = list(itertools.chain.from_iterable(status["chunks"] for status in results))
+                        new_chunks = st.session_state.vector_store.filter_new_documents(all_chunks)
+                        if len(new_chunks) < len(all_chunks):
+                            st.info(f"Skipped {len(all_chunks) - len(new_chunks)} chunks already in the vector store")
                         
                         # Add to vector store
-                        st.session_state.vector_store.add_documents(all_chunks)
+                        add_chunks_to_store(st.session_state.vector_store, new_chunks)
                         st.session_state.documents_loaded = True
+                        get_semantic_cache().clear()
+                        clear_store_caches()
                         
                         st.success(f"Successfully processed {len(uploaded_files)} documents with {len(all_chunks)} chunks")
                         
                 except Exception as e:
                     st.error(f"Error processing documents: {str(e)}")
 
+def _parse_quarter(quarter_label: str):
+    """Split a "YYYY QN" dropdown label into (year, quarter)."""
+    year, quarter = quarter_label.split()
+    return year, quarter
+
 def analysis_interface():
     """Main analysis interface."""
     st.header("🔍 Analysis Interface")
@@ -142,8 +294,8 @@ def analysis_interface():
     
     # Get available companies and quarters
     try:
-        companies = st.session_state.agent.get_available_companies()
-        quarters = st.session_state.agent.get_available_quarters()
+        companies = get_available_companies(st.session_state.agent)
+        quarters = get_available_quarters(st.session_state.agent)
     except Exception as e:
         st.error(f"Error getting available data: {str(e)}")
         companies=[]
@@ -153,33 +305,37 @@ def analysis_interface():
     if not quarters:
         quarters = []
     
-    # Analysis parameters based on type
+    quarter_options = [""] + [
+        f"{q['year']} {q['quarter']}" for q in quarters
+        if isinstance(q, dict) and "year" in q and "quarter" in q
+    ]
+    
+    # Analysis parameters based on type; inputs are grouped in forms so
+    # changing them does not rerun the script until the form is submitted
     if analysis_type == "insight":
         st.subheader("Insight Analysis")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            company = st.selectbox("Company (Optional)", [""] + companies)
-        with col2:
-            quarter_options = [""]
-            for q in quarters:
-                if isinstance(q,dict) and "year" in q and "quarter" in q:
-                    quarter_options.append(f"{q['year']} {q['quarter']}")
-            quarter_data = st.selectbox("Quarter (Optional)", quarter_options)
+        with st.form(key="insight_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                company = st.selectbox("Company (Optional)", [""] + companies)
+            with col2:
+                quarter_data = st.selectbox("Quarter (Optional)", quarter_options)
             
+            submitted = st.form_submit_button("Generate Insights", type="primary")
         
-        if st.button("Generate Insights", type="primary"):
+        if submitted:
             with st.spinner("Generating insights..."):
                 try:
                     params = {}
                     if company:
                         params["company"] = company
                     if quarter_data:
-                        year, quarter = quarter_data.split()
-                        params["year"] = year
-                        params["quarter"] = quarter
+                        params["year"], params["quarter"] = _parse_quarter(quarter_data)
                     
-                    result = st.session_state.agent.run_analysis("insight", **params)
+                    preview = st.empty()
+                    result = run_cached_analysis("insight", on_token=stream_to(preview), **params)
+                    preview.empty()
                     display_result(result, "insight")
                     
                 except Exception as e:
@@ -188,21 +344,24 @@ def analysis_interface():
     elif analysis_type == "compare":
         st.subheader("Comparative Analysis")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            company1 = st.selectbox("Company 1", companies)
-            year1 = st.selectbox("Year 1", ["2023", "2024"], key="year1")
-            quarter1 = st.selectbox("Quarter 1", ["Q1", "Q2", "Q3", "Q4"], key="quarter1")
-        
-        with col2:
-            company2 = st.selectbox("Company 2", companies)
-            year2 = st.selectbox("Year 2", ["2023", "2024"], key="year2")
-            quarter2 = st.selectbox("Quarter 2", ["Q1", "Q2", "Q3", "Q4"], key="quarter2")
+        with st.form(key="compare_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                company1 = st.selectbox("Company 1", companies)
+                year1 = st.selectbox("Year 1", ["2023", "2024"], key="year1")
+                quarter1 = st.selectbox("Quarter 1", ["Q1", "Q2", "Q3", "Q4"], key="quarter1")
+            
+            with col2:
+                company2 = st.selectbox("Company 2", companies)
+                year2 = st.selectbox("Year 2", ["2023", "2024"], key="year2")
+                quarter2 = st.selectbox("Quarter 2", ["Q1", "Q2", "Q3", "Q4"], key="quarter2")
+            
+            submitted = st.form_submit_button("Compare", type="primary")
         
-        if st.button("Compare", type="primary"):
+        if submitted:
             with st.spinner("Running comparison..."):
                 try:
-                    result = st.session_state.agent.run_analysis("compare", 
+                    result = run_cached_analysis("compare", 
                         company1=company1, company2=company2,
                         year1=year1, quarter1=quarter1,
                         year2=year2, quarter2=quarter2
@@ -215,29 +374,27 @@ def analysis_interface():
     elif analysis_type == "risk":
         st.subheader("Risk Analysis")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            company = st.selectbox("Company (Optional)", [""] + companies, key="risk_company")
-        with col2:
-            quarter_options = [""]
-            for q in quarters:
-                if isinstance(q, dict) and "year" in q and "quarter" in q:
-                    quarter_options.append(f"{q['year']} {q['quarter']}")
-            quarter_data = st.selectbox("Quarter (Optional)", quarter_options, key="risk_quarter")
+        with st.form(key="risk_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                company = st.selectbox("Company (Optional)", [""] + companies, key="risk_company")
+            with col2:
+                quarter_data = st.selectbox("Quarter (Optional)", quarter_options, key="risk_quarter")
             
+            submitted = st.form_submit_button("Analyze Risks", type="primary")
         
-        if st.button("Analyze Risks", type="primary"):
+        if submitted:
             with st.spinner("Analyzing risks..."):
                 try:
                     params = {}
                     if company:
                         params["company"] = company
                     if quarter_data:
-                        year, quarter = quarter_data.split()
-                        params["year"] = year
-                        params["quarter"] = quarter
+                        params["year"], params["quarter"] = _parse_quarter(quarter_data)
                     
-                    result = st.session_state.agent.run_analysis("risk", **params)
+                    preview = st.empty()
+                    result = run_cached_analysis("risk", on_token=stream_to(preview), **params)
+                    preview.empty()
                     display_result(result, "risk")
                     
                 except Exception as e:
@@ -246,29 +403,29 @@ def analysis_interface():
     elif analysis_type == "qa":
         st.subheader("Question & Answer")
         
-        question = st.text_area("Ask a question about the documents:", height=100)
+        with st.form(key="qa_form"):
+            question = st.text_area("Ask a question about the documents:", height=100)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                company = st.selectbox("Company (Optional)", [""] + companies, key="qa_company")
+            with col2:
+                quarter_data=st.selectbox("Quarter (Optional)",quarter_options, key="qa_quarter")
+            
+            submitted = st.form_submit_button("Get Answer", type="primary")
         
-        col1, col2 = st.columns(2)
-        with col1:
-            company = st.selectbox("Company (Optional)", [""] + companies, key="qa_company")
-        with col2:
-            quarter_options = [""]
-            for q in quarters:
-                if isinstance(q,dict) and "year" in q and "quarter" in q:
-                    quarter_options.append(f"{q['year']} {q['quarter']}")
-            quarter_data=st.selectbox("Quarter (Optional)",quarter_options, key="qa_quarter")
-        if st.button("Get Answer", type="primary"):
+        if submitted:
             with st.spinner("Finding answer..."):
                 try:
                     params = {"question": question}
                     if company:
                         params["company"] = company
                     if quarter_data:
-                        year, quarter = quarter_data.split()
-                        params["year"] = year
-                        params["quarter"] = quarter
+                        params["year"], params["quarter"] = _parse_quarter(quarter_data)
                     
-                    result = st.session_state.agent.run_analysis("qa", **params)
+                    preview = st.empty()
+                    result = run_cached_analysis("qa", on_token=stream_to(preview), **params)
+                    preview.empty()
                     display_result(result, "qa")
                     
                 except Exception as e:
@@ -322,22 +479,26 @@ def display_result(result: Dict[str, Any], analysis_type: str):
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("Export to Excel"):
-            try:
-                exporter = ExcelExporter()
-                filepath = exporter.export_analysis_result(result, analysis_type)
-                st.success(f"Exported to: {filepath}")
-            except Exception as e:
-                st.error(f"Error exporting to Excel: {str(e)}")
+        try:
+            st.download_button(
+                "Export to Excel",
+                data=export_excel_bytes(result, analysis_type),
+                file_name=get_excel_exporter().build_filename(analysis_type),
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+        except Exception as e:
+            st.error(f"Error exporting to Excel: {str(e)}")
     
     with col2:
-        if st.button("Export to PDF"):
-            try:
-                exporter = PDFExporter()
-                filepath = exporter.export_analysis_result(result, analysis_type)
-                st.success(f"Exported to: {filepath}")
-            except Exception as e:
-                st.error(f"Error exporting to PDF: {str(e)}")
+        try:
+            st.download_button(
+                "Export to PDF",
+                data=export_pdf_bytes(result, analysis_type),
+                file_name=get_pdf_exporter().build_filename(analysis_type),
+                mime="application/pdf"
+            )
+        except Exception as e:
+            st.error(f"Error exporting to PDF: {str(e)}")
 
 def system_status():
     """Display system status and statistics."""
@@ -347,7 +508,7 @@ def system_status():
         return
     
     try:
-        stats = st.session_state.agent.get_store_stats()
+        stats = get_store_stats(st.session_state.agent)
         
         col1, col2, col3 = st.columns(3)
         with col1:
@@ -363,6 +524,16 @@ def system_status():
         if stats.get("quarters"):
             quarters_str = [f"{q['year']} {q['quarter']}" for q in stats["quarters"]]
             st.write("**Available Quarters:**", ", ".join(quarters_str))
+        
+        cache_stats = get_semantic_cache().get_stats()
+        st.subheader("Query Cache")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            st.metric("Cached Results", cache_stats["entries"])
+        with col2:
+            st.metric("Cache Hits", cache_stats["hits"])
+        with col3:
+            st.metric("Hit Rate", f"{cache_stats['hit_rate']:.0%}")
             
     except Exception as e:
         st.error(f"Error getting system status: {str(e)}")
@@ -372,6 +543,12 @@ def main():
     st.markdown('<h1 class="main-header">📊 AnalystGPT</h1>', unsafe_allow_html=True)
     st.markdown('<p style="text-align: center; font-size: 1.2rem; color: #666;">AI-Powered Financial Document Analysis</p>', unsafe_allow_html=True)
     
+    try:
+        get_config()
+    except ValueError as e:
+        st.error(f"Configuration error: {str(e)}")
+        st.stop()
+    
     # Sidebar navigation
     st.sidebar.title("Navigation")
     page = st.sidebar.selectbox(
@@ -0,0 +1,103 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+import constants
+
+logger = logging.getLogger(__name__)
+
+class SemanticCache:
+    """In-memory cache of analysis results keyed by query embedding.
+
+    Entries are scoped by a params key (analysis type, company, year,
+    quarter), so a hit requires an exact scope match plus a cosine
+    similarity above the threshold between the query embeddings. Requests
+    without free-text queries (insight, compare, risk) match on scope alone
+    and never call the embedding model.
+    """
+
+    def __init__(self, embed_fn: Callable[[str], List[float]],
+                 threshold: float = constants.SEMANTIC_CACHE_THRESHOLD,
+                 ttl_seconds: int = constants.SEMANTIC_CACHE_TTL,
+                 max_entries: int = constants.SEMANTIC_CACHE_MAX_ENTRIES):
+        self.embed_fn = embed_fn
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Each entry is (embedding, params_key, result, created_at)
+        self._entries: List[Tuple[Optional[np.ndarray], Tuple, Dict[str, Any], float]] = []
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _embed(self, query: str) -> np.ndarray:
+        """Embed and L2-normalize a query so a dot product is the cosine similarity."""
+        vector = np.asarray(self.embed_fn(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def _evict_expired(self, now: float):
+        self._entries = [entry for entry in self._entries if now - entry[3] < self.ttl_seconds]
+    
+    def lookup(self, params_key: Tuple, query: Optional[str] = None) -> Tuple[Optional[Dict[str, Any]], Optional[np.ndarray]]:
+        """Return (cached result or None, query embedding).
+
+        The embedding is returned so a miss can be stored with set()
+        without embedding the query a second time. If the query cannot be
+        embedded this is (None, None): the cache is only an optimisation,
+        so the analysis goes ahead uncached.
+        """
+        embedding = None
+        if query:
+            try:
+                embedding = self._embed(query)
+            except Exception as e:
+                logger.warning("Semantic cache skipped, query embedding failed: %s", e)
+                with self._lock:
+                    self.misses += 1
+                return None, None
+        
+        with self._lock:
+            self._evict_expired(time.time())
+            candidates = [entry for entry in self._entries if entry[1] == params_key]
+            
+            result = None
+            if candidates and embedding is None:
+                result = candidates[-1][2]
+            elif candidates:
+                scored = [entry for entry in candidates if entry[0] is not None]
+                if scored:
+                    similarities = np.stack([entry[0] for entry in scored]) @ embedding
+                    best = int(np.argmax(similarities))
+                    if similarities[best] >= self.threshold:
+                        result = scored[best][2]
+            
+            if result is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        
+        return result, embedding
+    
+    def set(self, params_key: Tuple, result: Dict[str, Any], embedding: Optional[np.ndarray] = None):
+        """Store a result for the given scope and query embedding."""
+        with self._lock:
+            self._entries.append((embedding, params_key, result, time.time()))
+            if len(self._entries) > self.max_entries:
+                self._entries = self._entries[-self.max_entries:]
+    
+    def clear(self):
+        """Drop all entries, e.g. after new documents are ingested."""
+        with self._lock:
+            self._entries = []
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Get cache statistics."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
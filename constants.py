@@ -1,20 +1,37 @@
 import os
+from dataclasses import dataclass
+from functools import lru_cache
 from dotenv import load_dotenv
 
-load_dotenv()
-
 # Google Gemini Configuration
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if not GOOGLE_API_KEY:
-    raise ValueError("Missing GOOGLE_API_KEY in environment. Please set it in the .env file.")
-
 GEMINI_MODEL = "gemini-1.5-pro"
+GEMINI_FAST_MODEL = "gemini-1.5-flash"  # Used for requests with little context
+FAST_QA_MAX_DOCUMENTS = 2  # QA on at most this many chunks goes to the fast model...
+FAST_QA_MAX_QUESTION_CHARS = 200  # ...when the question is also shorter than this
+FAST_RISK_MAX_DOCUMENTS = 3  # Risk analysis on at most this many chunks goes to the fast model
 
 # Vector Database Configuration
 VECTOR_DB_PATH = "vector_store"
 EMBEDDING_MODEL = "models/embedding-001"  # Google's embedding model
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 200
+EMBEDDING_BATCH_SIZE = 100  # Chunks per embedding request
+EMBEDDING_WORKERS = 8  # Concurrent embedding requests during ingestion
+FLUSH_EVERY_DOCUMENTS = 500  # Chunks embedded between saves of the vector store during ingestion
+QUERY_EMBEDDING_CACHE_SIZE = 1024  # Query strings whose embeddings are kept in memory
+PARALLEL_PAGE_THRESHOLD = 2000  # Minimum pages before opted-in extraction is spread across processes
+CONTEXT_TOKEN_BUDGET = 24000  # Approximate prompt-context budget per LLM call
+TOKENIZER_ENCODING = "cl100k_base"  # tiktoken encoding used to count context tokens
+LLM_MAX_CONCURRENCY = 4  # Concurrent Gemini calls when analyses are fanned out
+HNSW_M = 32  # Graph neighbours per vector in the HNSW index
+HNSW_EF_CONSTRUCTION = 80  # Candidate list size while building the index
+HNSW_EF_SEARCH = 20  # Candidate list size per query (raised to k automatically)
+SQ_RANGE_MARGIN = 0.2  # Widening of the 8-bit quantizer range learned from the first batch
+
+# Semantic Cache Configuration
+SEMANTIC_CACHE_THRESHOLD = 0.9  # Minimum cosine similarity for a cache hit
+SEMANTIC_CACHE_TTL = 7 * 24 * 60 * 60  # 7 days
+SEMANTIC_CACHE_MAX_ENTRIES = 1000
 
 # File Processing
 SUPPORTED_FORMATS = (".pdf",)
@@ -41,3 +58,22 @@ METADATA_FIELDS = [
 
 # Export Options
 EXPORT_FORMATS = ("pdf", "excel")
+
+@dataclass(frozen=True)
+class Config:
+    """Runtime settings read from the environment."""
+    google_api_key: str
+    gemini_model: str = GEMINI_MODEL
+    embedding_model: str = EMBEDDING_MODEL
+    vector_db_path: str = VECTOR_DB_PATH
+
+@lru_cache(maxsize=1)
+def load_config() -> Config:
+    """Load the .env file once and validate the required settings."""
+    load_dotenv()
+    
+    google_api_key = os.getenv("GOOGLE_API_KEY")
+    if not google_api_key:
+        raise ValueError("Missing GOOGLE_API_KEY in environment. Please set it in the .env file.")
+    
+    return Config(google_api_key=google_api_key)
@@ -1,36 +1,65 @@
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, BinaryIO
 from datetime import datetime
-import os
+import re
+from pathlib import Path
+
+# Output directory, created once at import rather than per export
+_EXPORT_DIR = Path("exports")
+_EXPORT_DIR.mkdir(exist_ok=True)
 
 class ExcelExporter:
-    def __init__(self):
-        self.export_dir = "exports"
-        os.makedirs(self.export_dir, exist_ok=True)
+    # Section headers produced by the analysis prompts, one pattern per analysis type
+    _INSIGHT_HEADERS = re.compile(
+        r'(?i)\b(executive summary|key financial metrics|business highlights|'
+        r'strategic initiatives|risk factors|outlook)\b'
+    )
+    _COMPARE_HEADERS = re.compile(
+        r'(?i)\b(executive summary|key metrics comparison|performance analysis|'
+        r'strategic comparison|risk and outlook|investment implications)\b'
+    )
+    _RISK_HEADERS = re.compile(
+        r'(?i)\b(executive summary|risk categories|risk assessment|risk mitigation|'
+        r'emerging risks|risk metrics|investment implications)\b'
+    )
     
     def export_analysis_result(self, result: Dict[str, Any], analysis_type: str) -> str:
         """Export analysis result to Excel."""
         try:
-            # Create a new Excel writer
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"analystgpt_{analysis_type}_{timestamp}.xlsx"
-            filepath = os.path.join(self.export_dir, filename)
-            
-            with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
-                # Export main analysis
-                self._export_main_analysis(result, analysis_type, writer)
-                
-                # Export metadata
-                self._export_metadata(result, writer)
-                
-                # Export source information
-                self._export_source_info(result, writer)
+            now = datetime.now()
+            filepath = _EXPORT_DIR / self.build_filename(analysis_type, now)
+            self._write_workbook(result, analysis_type, filepath, now)
+            return str(filepath)
             
-            return filepath
+        except Exception as e:
+            raise Exception(f"Error exporting to Excel: {str(e)}")
+    
+    def export_to_buffer(self, result: Dict[str, Any], analysis_type: str, buffer: BinaryIO) -> BinaryIO:
+        """Export analysis result to Excel into an in-memory buffer instead of a file."""
+        try:
+            self._write_workbook(result, analysis_type, buffer, datetime.now())
+            return buffer
             
         except Exception as e:
             raise Exception(f"Error exporting to Excel: {str(e)}")
     
+    def build_filename(self, analysis_type: str, now: datetime = None) -> str:
+        """Timestamped file name for an export."""
+        now = now or datetime.now()
+        return f"analystgpt_{analysis_type}_{now:%Y%m%d_%H%M%S}.xlsx"
+    
+    def _write_workbook(self, result: Dict[str, Any], analysis_type: str, target, now: datetime):
+        """Write all sheets to a file path or binary buffer."""
+        # constant_memory flushes each row to disk once the next row starts, so
+        # sheets are written row by row through _write_table, not DataFrame.to_excel
+        with pd.ExcelWriter(target, engine='xlsxwriter',
+                            engine_kwargs={'options': {'constant_memory': True}}) as writer:
+            # Export main analysis
+            self._export_main_analysis(result, analysis_type, writer)
+            
+            # Export metadata and source information
+            self._export_metadata(result, writer, now)
+    
     def _export_main_analysis(self, result: Dict[str, Any], analysis_type: str, writer):
         """Export the main analysis content."""
         if "result" not in result:
@@ -50,18 +79,11 @@ class ExcelExporter:
     def _export_insight_analysis(self, result: Dict[str, Any], writer):
         """Export insight analysis to Excel."""
         if "insights" in result:
-            # Create DataFrame for insights
             insights_text = result["insights"]
             
             # Split insights into sections (basic parsing)
-            sections = self._parse_insights_sections(insights_text)
-            
-            for section_name, content in sections.items():
-                df = pd.DataFrame({
-                    "Section": [section_name],
-                    "Content": [content]
-                })
-                df.to_excel(writer, sheet_name=section_name[:31], index=False)
+            sections = self._parse_sections(insights_text, self._INSIGHT_HEADERS)
+            self._export_sections(sections, "Insight Analysis", writer)
     
     def _export_compare_analysis(self, result: Dict[str, Any], writer):
         """Export comparison analysis to Excel."""
@@ -69,14 +91,8 @@ class ExcelExporter:
             comparison_text = result["comparison"]
             
             # Split comparison into sections
-            sections = self._parse_comparison_sections(comparison_text)
-            
-            for section_name, content in sections.items():
-                df = pd.DataFrame({
-                    "Section": [section_name],
-                    "Content": [content]
-                })
-                df.to_excel(writer, sheet_name=section_name[:31], index=False)
+            sections = self._parse_sections(comparison_text, self._COMPARE_HEADERS)
+            self._export_sections(sections, "Compare Analysis", writer)
     
     def _export_risk_analysis(self, result: Dict[str, Any], writer):
         """Export risk analysis to Excel."""
@@ -84,133 +100,71 @@ class ExcelExporter:
             risk_text = result["risk_analysis"]
             
             # Split risk analysis into sections
-            sections = self._parse_risk_sections(risk_text)
-            
-            for section_name, content in sections.items():
-                df = pd.DataFrame({
-                    "Section": [section_name],
-                    "Content": [content]
-                })
-                df.to_excel(writer, sheet_name=section_name[:31], index=False)
+            sections = self._parse_sections(risk_text, self._RISK_HEADERS)
+            self._export_sections(sections, "Risk Analysis", writer)
+    
+    def _export_sections(self, sections: Dict[str, str], sheet_name: str, writer):
+        """Write all parsed sections to a single sheet in one pass."""
+        self._write_table(writer, sheet_name, ["Section", "Content"], list(sections.items()))
+    
+    def _write_table(self, writer, sheet_name: str, columns: List[str], rows: List[tuple]):
+        """Write a header row and data rows to a new sheet in row order."""
+        worksheet = writer.book.add_worksheet(sheet_name[:31])
+        worksheet.write_row(0, 0, columns)
+        for row_index, row in enumerate(rows, 1):
+            worksheet.write_row(row_index, 0, row)
     
     def _export_qa_analysis(self, result: Dict[str, Any], writer):
         """Export QA analysis to Excel."""
         if "answer" in result:
-            df = pd.DataFrame({
-                "Question": [result.get("question", "")],
-                "Answer": [result.get("answer", "")],
-                "Source Documents": [result.get("source_documents", 0)],
-                "Companies": [", ".join(result.get("companies", []))],
-                "Quarters": [", ".join(result.get("quarters", []))]
-            })
-            df.to_excel(writer, sheet_name="Q&A Analysis", index=False)
+            columns = ["Question", "Answer", "Source Documents", "Companies", "Quarters"]
+            row = (
+                result.get("question", ""),
+                result.get("answer", ""),
+                result.get("source_documents", 0),
+                ", ".join(result.get("companies", [])),
+                ", ".join(result.get("quarters", []))
+            )
+            self._write_table(writer, "Q&A Analysis", columns, [row])
     
-    def _export_metadata(self, result: Dict[str, Any], writer):
-        """Export metadata to Excel."""
+    def _export_metadata(self, result: Dict[str, Any], writer, now: datetime):
+        """Export metadata and source information to a single Info sheet."""
         metadata = {
             "Analysis Type": result.get("analysis_type", ""),
             "Status": result.get("status", ""),
-            "Timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "Timestamp": f"{now:%Y-%m-%d %H:%M:%S}",
             "Source Documents": result.get("result", {}).get("source_documents", 0),
             "Companies": ", ".join(result.get("result", {}).get("companies", [])),
             "Quarters": ", ".join(result.get("result", {}).get("quarters", []))
         }
         
-        df = pd.DataFrame(list(metadata.items()), columns=["Field", "Value"])
-        df.to_excel(writer, sheet_name="Metadata", index=False)
-    
-    def _export_source_info(self, result: Dict[str, Any], writer):
-        """Export source information to Excel."""
-        if "result" in result:
-            analysis_result = result["result"]
-            
-            source_info = {
-                "Source Documents": analysis_result.get("source_documents", 0),
-                "Companies": ", ".join(analysis_result.get("companies", [])),
-                "Quarters": ", ".join(analysis_result.get("quarters", []))
-            }
-            
-            df = pd.DataFrame(list(source_info.items()), columns=["Field", "Value"])
-            df.to_excel(writer, sheet_name="Source Info", index=False)
-    
-    def _parse_insights_sections(self, text: str) -> Dict[str, str]:
-        """Parse insights text into sections."""
-        sections = {}
-        current_section = "General"
-        current_content = []
-        
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Check for section headers
-            if any(keyword in line.lower() for keyword in ["executive summary", "key financial metrics", "business highlights", "strategic initiatives", "risk factors", "outlook"]):
-                if current_content:
-                    sections[current_section] = '\n'.join(current_content)
-                current_section = line
-                current_content = []
-            else:
-                current_content.append(line)
-        
-        # Add the last section
-        if current_content:
-            sections[current_section] = '\n'.join(current_content)
-        
-        return sections
-    
-    def _parse_comparison_sections(self, text: str) -> Dict[str, str]:
-        """Parse comparison text into sections."""
-        sections = {}
-        current_section = "General"
-        current_content = []
-        
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
-            
-            # Check for section headers
-            if any(keyword in line.lower() for keyword in ["executive summary", "key metrics comparison", "performance analysis", "strategic comparison", "risk and outlook", "investment implications"]):
-                if current_content:
-                    sections[current_section] = '\n'.join(current_content)
-                current_section = line
-                current_content = []
-            else:
-                current_content.append(line)
-        
-        # Add the last section
-        if current_content:
-            sections[current_section] = '\n'.join(current_content)
-        
-        return sections
+        self._write_table(writer, "Info", ["Field", "Value"], list(metadata.items()))
     
-    def _parse_risk_sections(self, text: str) -> Dict[str, str]:
-        """Parse risk analysis text into sections."""
+    def _parse_sections(self, text: str, header_pattern: re.Pattern) -> Dict[str, str]:
+        """Split analysis text into sections at lines matching the header pattern."""
         sections = {}
         current_section = "General"
-        current_content = []
+        section_start = 0
+        pos = 0
+        search = header_pattern.search
         
-        lines = text.split('\n')
-        for line in lines:
-            line = line.strip()
-            if not line:
-                continue
+        # Track offsets into the original text and slice each section once
+        for line in text.splitlines(keepends=True):
+            line_start = pos
+            pos += len(line)
             
             # Check for section headers
-            if any(keyword in line.lower() for keyword in ["executive summary", "risk categories", "risk assessment", "risk mitigation", "emerging risks", "risk metrics", "investment implications"]):
-                if current_content:
-                    sections[current_section] = '\n'.join(current_content)
-                current_section = line
-                current_content = []
-            else:
-                current_content.append(line)
+            if search(line):
+                content = text[section_start:line_start].strip()
+                if content:
+                    sections[current_section] = content
+                current_section = line.strip()
+                section_start = pos
         
         # Add the last section
-        if current_content:
-            sections[current_section] = '\n'.join(current_content)
+        content = text[section_start:].strip()
+        if content:
+            sections[current_section] = content
         
         return sections
 
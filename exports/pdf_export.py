@@ -1,130 +1,236 @@
+from reportlab import rl_config
+
+# Set before the rest of ReportLab is imported: skip per-attribute shape
+# validation and leave out per-build timestamps/IDs (content is unchanged)
+rl_config.shapeChecking = 0
+rl_config.invariant = 1
+
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle, StyleSheet1
 from reportlab.lib.units import inch
 from reportlab.lib import colors
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Tuple
+import io
+import re
 from datetime import datetime
-import os
+from functools import lru_cache
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+@lru_cache(maxsize=1)
+def _get_styles() -> StyleSheet1:
+    """Sample stylesheet plus the exporter's custom styles, built once per process."""
+    styles = getSampleStyleSheet()
+    
+    # Custom styles (named so they do not collide with the sample styles)
+    styles.add(ParagraphStyle(
+        name='Heading1Custom',
+        parent=styles['Heading1'],
+        fontSize=16,
+        spaceAfter=12,
+        textColor=colors.darkblue
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='Heading2Custom',
+        parent=styles['Heading2'],
+        fontSize=14,
+        spaceAfter=8,
+        textColor=colors.darkblue
+    ))
+    
+    styles.add(ParagraphStyle(
+        name='BodyTextCustom',
+        parent=styles['BodyText'],
+        fontSize=10,
+        spaceAfter=6
+    ))
+    
+    return styles
+
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+
+# Table styles are parsed once and shared by every export
+_METADATA_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, 0), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+_QA_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('BACKGROUND', (0, 1), (0, 1), colors.lightgrey),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+_SOURCE_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (0, 0), colors.grey),
+    ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
+    ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+    ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 10),
+    ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+    ('GRID', (0, 0), (-1, -1), 1, colors.black)
+])
+
+def _build_table(rows, col_widths: List[float], style: TableStyle) -> Table:
+    """New Table per document; layout stores per-document state on the flowable."""
+    table = Table([list(row) for row in rows], colWidths=col_widths)
+    table.setStyle(style)
+    return table
+
+@lru_cache(maxsize=128)
+def _metadata_rows(analysis_type: str, status: str, companies: tuple,
+                   quarters: tuple, source_docs) -> Tuple[Tuple[str, str], ...]:
+    """Metadata table rows for a report; batch exports of one corpus repeat the same fields.
+    
+    source_docs is None when the result has no analysis payload. The timestamp
+    is rendered separately so it does not break the cache.
+    """
+    rows = (
+        ("Field", "Value"),
+        ("Analysis Type", analysis_type.title()),
+        ("Status", status.title())
+    )
+    if source_docs is not None:
+        rows += (
+            ("Source Documents", str(source_docs)),
+            ("Companies", ", ".join(companies)),
+            ("Quarters", ", ".join(quarters))
+        )
+    return rows
+
+@lru_cache(maxsize=128)
+def _source_rows(companies: tuple, quarters: tuple, source_documents) -> Tuple[Tuple[str, str], ...]:
+    """Source information table rows of a Q&A report."""
+    return (
+        ("Source Documents", str(source_documents)),
+        ("Companies", ", ".join(companies)),
+        ("Quarters", ", ".join(quarters))
+    )
+
+# Output directory, created once at import rather than per export
+_EXPORT_DIR = Path("exports")
+_EXPORT_DIR.mkdir(exist_ok=True)
 
 class PDFExporter:
     def __init__(self):
-        self.export_dir = "exports"
-        os.makedirs(self.export_dir, exist_ok=True)
-        self.styles = getSampleStyleSheet()
-        
-        # Custom styles
-        self.styles.add(ParagraphStyle(
-            name='Heading1',
-            parent=self.styles['Heading1'],
-            fontSize=16,
-            spaceAfter=12,
-            textColor=colors.darkblue
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='Heading2',
-            parent=self.styles['Heading2'],
-            fontSize=14,
-            spaceAfter=8,
-            textColor=colors.darkblue
-        ))
-        
-        self.styles.add(ParagraphStyle(
-            name='BodyText',
-            parent=self.styles['BodyText'],
-            fontSize=10,
-            spaceAfter=6
-        ))
+        self.styles = _get_styles()
     
     def export_analysis_result(self, result: Dict[str, Any], analysis_type: str) -> str:
         """Export analysis result to PDF."""
         try:
-            # Create filename
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"analystgpt_{analysis_type}_{timestamp}.pdf"
-            filepath = os.path.join(self.export_dir, filename)
+            now = datetime.now()
+            filepath = _EXPORT_DIR / self.build_filename(analysis_type, now)
             
-            # Create PDF document
-            doc = SimpleDocTemplate(filepath, pagesize=A4)
-            story = []
+            # Rendered in memory so the file is written in a single call
+            with open(filepath, 'wb') as f:
+                f.write(self._render(self._build_story(result, analysis_type, now)))
             
-            # Add title
-            story.append(Paragraph(f"AnalystGPT - {analysis_type.title()} Analysis", self.styles['Heading1']))
-            story.append(Spacer(1, 12))
-            
-            # Add metadata
-            story.extend(self._create_metadata_section(result))
-            story.append(Spacer(1, 12))
-            
-            # Add main analysis content
-            story.extend(self._create_analysis_section(result, analysis_type))
-            
-            # Build PDF
-            doc.build(story)
-            
-            return filepath
+            return str(filepath)
             
         except Exception as e:
             raise Exception(f"Error exporting to PDF: {str(e)}")
     
-    def _create_metadata_section(self, result: Dict[str, Any]) -> List:
+    def export_analysis_result_bytes(self, result: Dict[str, Any], analysis_type: str) -> bytes:
+        """Export analysis result to PDF bytes without touching the disk."""
+        try:
+            return self._render(self._build_story(result, analysis_type, datetime.now()))
+        except Exception as e:
+            raise Exception(f"Error exporting to PDF: {str(e)}")
+    
+    def build_filename(self, analysis_type: str, now: datetime = None) -> str:
+        """Timestamped file name for an export."""
+        now = now or datetime.now()
+        return f"analystgpt_{analysis_type}_{now:%Y%m%d_%H%M%S}.pdf"
+    
+    def _build_story(self, result: Dict[str, Any], analysis_type: str, now: datetime) -> List:
+        """Assemble the flowables for a report."""
+        story = []
+        
+        # Add title
+        story.append(Paragraph(f"AnalystGPT - {analysis_type.title()} Analysis", self.styles['Heading1Custom']))
+        story.append(Spacer(1, 12))
+        
+        # Add metadata
+        story.extend(self._create_metadata_section(result, now))
+        story.append(Spacer(1, 12))
+        
+        # Add main analysis content
+        story.extend(self._create_analysis_section(result, analysis_type))
+        
+        return story
+    
+    def _render(self, story: List) -> bytes:
+        """Build the story into an in-memory PDF."""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=A4)
+        doc.build(story)
+        return buffer.getvalue()
+    
+    def _create_metadata_section(self, result: Dict[str, Any], now: datetime) -> List:
         """Create metadata section for PDF."""
         elements = []
         
-        elements.append(Paragraph("Analysis Information", self.styles['Heading2']))
-        
-        # Create metadata table
-        metadata_data = [
-            ["Field", "Value"],
-            ["Analysis Type", result.get("analysis_type", "").title()],
-            ["Status", result.get("status", "").title()],
-            ["Timestamp", datetime.now().strftime("%Y-%m-%d %H:%M:%S")]
-        ]
-        
-        if "result" in result:
-            analysis_result = result["result"]
-            metadata_data.extend([
-                ["Source Documents", str(analysis_result.get("source_documents", 0))],
-                ["Companies", ", ".join(analysis_result.get("companies", []))],
-                ["Quarters", ", ".join(analysis_result.get("quarters", []))]
-            ])
-        
-        metadata_table = Table(metadata_data, colWidths=[2*inch, 4*inch])
-        metadata_table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 10),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black)
-        ]))
+        elements.append(Paragraph("Analysis Information", self.styles['Heading2Custom']))
+        
+        analysis_result = result.get("result")
+        if analysis_result is not None:
+            companies = tuple(analysis_result.get("companies", []))
+            quarters = tuple(analysis_result.get("quarters", []))
+            source_docs = analysis_result.get("source_documents", 0)
+        else:
+            companies, quarters, source_docs = (), (), None
+        
+        metadata_rows = _metadata_rows(
+            result.get("analysis_type", ""), result.get("status", ""), companies, quarters, source_docs
+        )
+        metadata_table = _build_table(metadata_rows, [2*inch, 4*inch], _METADATA_TABLE_STYLE)
         
         elements.append(metadata_table)
+        elements.append(Spacer(1, 6))
+        elements.append(Paragraph(f"Generated: {now:%Y-%m-%d %H:%M:%S}", self.styles['BodyTextCustom']))
         elements.append(Spacer(1, 12))
         
         return elements
     
+    def _make_paragraphs(self, text: str, style: ParagraphStyle) -> List[Paragraph]:
+        """One Paragraph per block of generated text.
+        
+        The text is escaped so it is not interpreted as ReportLab markup, and
+        line breaks become <br/>. Short blocks keep the line breaker cheap.
+        """
+        paragraphs = []
+        for block in _BLANK_LINES_RE.split(text.strip()):
+            lines = (" ".join(line.split()) for line in block.splitlines())
+            markup = "<br/>".join(escape(line) for line in lines if line)
+            if markup:
+                paragraphs.append(Paragraph(markup, style))
+        return paragraphs
+    
     def _create_analysis_section(self, result: Dict[str, Any], analysis_type: str) -> List:
         """Create main analysis section for PDF."""
         elements = []
         
         if "result" not in result:
-            elements.append(Paragraph("No analysis results available", self.styles['BodyText']))
+            elements.append(Paragraph("No analysis results available", self.styles['BodyTextCustom']))
             return elements
         
-        analysis_result = result["result"]
-        
-        if analysis_type == "insight":
-            elements.extend(self._create_insight_section(analysis_result))
-        elif analysis_type == "compare":
-            elements.extend(self._create_compare_section(analysis_result))
-        elif analysis_type == "risk":
-            elements.extend(self._create_risk_section(analysis_result))
-        elif analysis_type == "qa":
-            elements.extend(self._create_qa_section(analysis_result))
+        builder = self._SECTION_BUILDERS.get(analysis_type)
+        if builder:
+            elements.extend(builder(self, result["result"]))
         
         return elements
     
@@ -132,14 +238,14 @@ class PDFExporter:
         """Create insight analysis section."""
         elements = []
         
-        elements.append(Paragraph("Financial Insights Analysis", self.styles['Heading2']))
+        elements.append(Paragraph("Financial Insights Analysis", self.styles['Heading2Custom']))
         elements.append(Spacer(1, 8))
         
         if "insights" in result:
             insights_text = result["insights"]
-            elements.append(Paragraph(insights_text, self.styles['BodyText']))
+            elements.extend(self._make_paragraphs(insights_text, self.styles['BodyTextCustom']))
         else:
-            elements.append(Paragraph("No insights available", self.styles['BodyText']))
+            elements.append(Paragraph("No insights available", self.styles['BodyTextCustom']))
         
         return elements
     
@@ -147,14 +253,14 @@ class PDFExporter:
         """Create comparison analysis section."""
         elements = []
         
-        elements.append(Paragraph("Comparative Analysis", self.styles['Heading2']))
+        elements.append(Paragraph("Comparative Analysis", self.styles['Heading2Custom']))
         elements.append(Spacer(1, 8))
         
         if "comparison" in result:
             comparison_text = result["comparison"]
-            elements.append(Paragraph(comparison_text, self.styles['BodyText']))
+            elements.extend(self._make_paragraphs(comparison_text, self.styles['BodyTextCustom']))
         else:
-            elements.append(Paragraph("No comparison available", self.styles['BodyText']))
+            elements.append(Paragraph("No comparison available", self.styles['BodyTextCustom']))
         
         return elements
     
@@ -162,14 +268,14 @@ class PDFExporter:
         """Create risk analysis section."""
         elements = []
         
-        elements.append(Paragraph("Risk Analysis", self.styles['Heading2']))
+        elements.append(Paragraph("Risk Analysis", self.styles['Heading2Custom']))
         elements.append(Spacer(1, 8))
         
         if "risk_analysis" in result:
             risk_text = result["risk_analysis"]
-            elements.append(Paragraph(risk_text, self.styles['BodyText']))
+            elements.extend(self._make_paragraphs(risk_text, self.styles['BodyTextCustom']))
         else:
-            elements.append(Paragraph("No risk analysis available", self.styles['BodyText']))
+            elements.append(Paragraph("No risk analysis available", self.styles['BodyTextCustom']))
         
         return elements
     
@@ -177,7 +283,7 @@ class PDFExporter:
         """Create Q&A analysis section."""
         elements = []
         
-        elements.append(Paragraph("Question & Answer Analysis", self.styles['Heading2']))
+        elements.append(Paragraph("Question & Answer Analysis", self.styles['Heading2Custom']))
         elements.append(Spacer(1, 8))
         
         if "answer" in result:
@@ -187,46 +293,34 @@ class PDFExporter:
                 ["Answer", result.get("answer", "")]
             ]
             
-            qa_table = Table(qa_data, colWidths=[1.5*inch, 4.5*inch])
-            qa_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('BACKGROUND', (0, 1), (0, 1), colors.lightgrey),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            # Not cached: the answer text is unique to each result
+            qa_table = _build_table(qa_data, [1.5*inch, 4.5*inch], _QA_TABLE_STYLE)
             
             elements.append(qa_table)
             elements.append(Spacer(1, 12))
             
             # Add source information
-            elements.append(Paragraph("Source Information", self.styles['Heading2']))
-            source_data = [
-                ["Source Documents", str(result.get("source_documents", 0))],
-                ["Companies", ", ".join(result.get("companies", []))],
-                ["Quarters", ", ".join(result.get("quarters", []))]
-            ]
-            
-            source_table = Table(source_data, colWidths=[2*inch, 4*inch])
-            source_table.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (0, 0), colors.grey),
-                ('TEXTCOLOR', (0, 0), (0, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (0, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black)
-            ]))
+            elements.append(Paragraph("Source Information", self.styles['Heading2Custom']))
+            source_rows = _source_rows(
+                tuple(result.get("companies", [])),
+                tuple(result.get("quarters", [])),
+                result.get("source_documents", 0)
+            )
+            source_table = _build_table(source_rows, [2*inch, 4*inch], _SOURCE_TABLE_STYLE)
             
             elements.append(source_table)
         else:
-            elements.append(Paragraph("No Q&A available", self.styles['BodyText']))
+            elements.append(Paragraph("No Q&A available", self.styles['BodyTextCustom']))
         
         return elements
+    
+    # Section builder per analysis type; subclasses can extend this mapping
+    _SECTION_BUILDERS = {
+        "insight": _create_insight_section,
+        "compare": _create_compare_section,
+        "risk": _create_risk_section,
+        "qa": _create_qa_section,
+    }
 
 # Example usage
 if __name__ == "__main__":
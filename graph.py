@@ -1,191 +1,206 @@
-from typing import Dict, Any, List
-from langgraph.graph import StateGraph, END
-from langgraph.prebuilt import ToolNode
-from langchain.schema import BaseMessage, HumanMessage, AIMessage
-from langchain.tools import BaseTool
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import Dict, Any, List, Optional, Callable
+from dataclasses import dataclass, field, fields
+from functools import cached_property, partial
+import asyncio
+import importlib
 import constants
 
-# Import our tools
-from tools.insight_tool import InsightTool
-from tools.compare_tool import CompareTool
-from tools.risk_tool import RiskTool
-from tools.pdf_qa_tool import PDFQATool
+# Tool classes by analysis type, imported on first use
+_TOOL_CLASSES = {
+    "insight": ("tools.insight_tool", "InsightTool"),
+    "compare": ("tools.compare_tool", "CompareTool"),
+    "risk": ("tools.risk_tool", "RiskTool"),
+    "qa": ("tools.pdf_qa_tool", "PDFQATool"),
+}
+
+@dataclass
+class AnalysisState:
+    """Parameters and outcome of a single analysis request."""
+    analysis_type: str = "qa"
+    company: Optional[str] = None
+    year: Optional[str] = None
+    quarter: Optional[str] = None
+    company1: Optional[str] = None
+    company2: Optional[str] = None
+    year1: Optional[str] = None
+    quarter1: Optional[str] = None
+    year2: Optional[str] = None
+    quarter2: Optional[str] = None
+    question: str = ""
+    analysis_result: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+    response: Optional[Dict[str, Any]] = None
+    # Receives response text as it streams (insight, risk and QA); not a query parameter
+    on_token: Optional[Callable[[str], None]] = None
+
+_STATE_FIELDS = frozenset(f.name for f in fields(AnalysisState))
 
 class AnalystGPTAgent:
     def __init__(self, vector_store):
         self.vector_store = vector_store
-        self.llm = ChatGoogleGenerativeAI(
-            model=constants.GEMINI_MODEL,
-            google_api_key=constants.GOOGLE_API_KEY,
-            temperature=0.1
-        )
         
-        # Initialize tools
-        self.insight_tool = InsightTool()
-        self.compare_tool = CompareTool()
-        self.risk_tool = RiskTool()
-        self.qa_tool = PDFQATool()
+        # Tools are created lazily by _get_tool
+        self._tools = {}
         
-        # Create the graph
-        self.graph = self._create_graph()
+        # Results that only change when documents are added, keyed by
+        # name and stamped with the vector store version they were read at
+        self._store_cache = {}
     
-    def _create_graph(self) -> StateGraph:
-        """Create the LangGraph workflow."""
-        
-        # Define the state schema
-        workflow = StateGraph(state_schema=Dict[str, Any])
-        
-        # Add nodes
-        workflow.add_node("route", self._route_request)
-        workflow.add_node("insight", self._run_insight_analysis)
-        workflow.add_node("compare", self._run_compare_analysis)
-        workflow.add_node("risk", self._run_risk_analysis)
-        workflow.add_node("qa", self._run_qa_analysis)
-        workflow.add_node("format_response", self._format_response)
-        
-        # Add edges
-        workflow.add_edge("route", "insight")
-        workflow.add_edge("route", "compare")
-        workflow.add_edge("route", "risk")
-        workflow.add_edge("route", "qa")
-        
-        workflow.add_edge("insight", "format_response")
-        workflow.add_edge("compare", "format_response")
-        workflow.add_edge("risk", "format_response")
-        workflow.add_edge("qa", "format_response")
-        
-        workflow.add_edge("format_response", END)
-        
-        # Set entry point
-        workflow.set_entry_point("route")
-        
-        return workflow.compile()
+    @cached_property
+    def llm(self):
+        """Agent-level chat model, created on first access; the tools get the same instance from get_llm."""
+        from tools._llm import get_llm
+        return get_llm()
     
-    def _route_request(self, state: Dict[str, Any]) -> str:
-        """Route the request to the appropriate analysis tool."""
-        analysis_type = state.get("analysis_type", "qa")
-        
-        if analysis_type == "insight":
-            return "insight"
-        elif analysis_type == "compare":
-            return "compare"
-        elif analysis_type == "risk":
-            return "risk"
-        else:
-            return "qa"
+    def _get_tool(self, name: str):
+        """Import and instantiate an analysis tool the first time it is needed."""
+        tool = self._tools.get(name)
+        if tool is None:
+            module_name, class_name = _TOOL_CLASSES[name]
+            # Not given self.llm: an injected model would also replace the tools' fast route
+            tool = getattr(importlib.import_module(module_name), class_name)()
+            self._tools[name] = tool
+        return tool
+    
+    def _cached(self, key, compute):
+        """Return compute() memoized until the vector store changes."""
+        version = getattr(self.vector_store, "version", None)
+        cached = self._store_cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = compute()
+        self._store_cache[key] = (version, value)
+        return value
     
-    def _run_insight_analysis(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _cached_search(self, query: str, k: int) -> List:
+        """Similarity search for fixed fallback queries, reused until new documents arrive."""
+        return self._cached(("search", query, k), lambda: self.vector_store.similarity_search(query, k=k))
+    
+    def _run_insight_analysis(self, state: AnalysisState) -> AnalysisState:
         """Run insight analysis."""
         try:
-            company = state.get("company")
-            year = state.get("year")
-            quarter = state.get("quarter")
+            company = state.company
+            year = state.year
+            quarter = state.quarter
+            tool = self._get_tool("insight")
             
             if company:
-                result = self.insight_tool.generate_company_insights(company, self.vector_store)
+                result = tool.generate_company_insights(company, self.vector_store, state.on_token)
             elif year and quarter:
-                result = self.insight_tool.generate_quarter_insights(year, quarter, self.vector_store)
+                result = tool.generate_quarter_insights(year, quarter, self.vector_store, state.on_token)
             else:
                 # General insight analysis
-                documents = self.vector_store.similarity_search("financial performance", k=10)
-                result = self.insight_tool.generate_insights(documents)
+                documents = self._cached_search("financial performance", 10)
+                result = tool.generate_insights(documents, state.on_token)
             
-            state["analysis_result"] = result
+            state.analysis_result = result
             return state
             
         except Exception as e:
-            state["error"] = f"Error in insight analysis: {str(e)}"
+            state.error = f"Error in insight analysis: {str(e)}"
             return state
     
-    def _run_compare_analysis(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _run_compare_analysis(self, state: AnalysisState) -> AnalysisState:
         """Run compare analysis."""
         try:
-            company1 = state.get("company1")
-            company2 = state.get("company2")
-            year1 = state.get("year1")
-            quarter1 = state.get("quarter1")
-            year2 = state.get("year2")
-            quarter2 = state.get("quarter2")
+            company1 = state.company1
+            company2 = state.company2
+            year1 = state.year1
+            quarter1 = state.quarter1
+            year2 = state.year2
+            quarter2 = state.quarter2
+            tool = self._get_tool("compare")
             
             if company1 and company2:
-                result = self.compare_tool.compare_companies(company1, company2, self.vector_store)
+                result = tool.compare_companies(company1, company2, self.vector_store)
             elif year1 and quarter1 and year2 and quarter2:
-                result = self.compare_tool.compare_quarters(year1, quarter1, year2, quarter2, self.vector_store)
+                result = tool.compare_quarters(year1, quarter1, year2, quarter2, self.vector_store)
             else:
-                state["error"] = "Insufficient parameters for comparison"
+                state.error = "Insufficient parameters for comparison"
                 return state
             
-            state["analysis_result"] = result
+            state.analysis_result = result
             return state
             
         except Exception as e:
-            state["error"] = f"Error in compare analysis: {str(e)}"
+            state.error = f"Error in compare analysis: {str(e)}"
             return state
     
-    def _run_risk_analysis(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _run_risk_analysis(self, state: AnalysisState) -> AnalysisState:
         """Run risk analysis."""
         try:
-            company = state.get("company")
-            year = state.get("year")
-            quarter = state.get("quarter")
+            company = state.company
+            year = state.year
+            quarter = state.quarter
+            tool = self._get_tool("risk")
             
             if company:
-                result = self.risk_tool.analyze_company_risks(company, self.vector_store)
+                result = tool.analyze_company_risks(company, self.vector_store, state.on_token)
             elif year and quarter:
-                result = self.risk_tool.analyze_quarter_risks(year, quarter, self.vector_store)
+                result = tool.analyze_quarter_risks(year, quarter, self.vector_store, state.on_token)
             else:
                 # General risk analysis
-                documents = self.vector_store.similarity_search("risk factors", k=10)
-                result = self.risk_tool.analyze_risks(documents)
+                documents = self._cached_search("risk factors", 10)
+                result = tool.analyze_risks(documents, state.on_token)
             
-            state["analysis_result"] = result
+            state.analysis_result = result
             return state
             
         except Exception as e:
-            state["error"] = f"Error in risk analysis: {str(e)}"
+            state.error = f"Error in risk analysis: {str(e)}"
             return state
     
-    def _run_qa_analysis(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    def _run_qa_analysis(self, state: AnalysisState) -> AnalysisState:
         """Run QA analysis."""
         try:
-            question = state.get("question", "")
-            company = state.get("company")
-            year = state.get("year")
-            quarter = state.get("quarter")
+            question = state.question
+            company = state.company
+            year = state.year
+            quarter = state.quarter
             
             if not question:
-                state["error"] = "No question provided"
+                state.error = "No question provided"
                 return state
             
+            tool = self._get_tool("qa")
+            
             if company:
-                result = self.qa_tool.answer_company_question(question, company, self.vector_store)
+                result = tool.answer_company_question(question, company, self.vector_store, state.on_token)
             elif year and quarter:
-                result = self.qa_tool.answer_quarter_question(question, year, quarter, self.vector_store)
+                result = tool.answer_quarter_question(question, year, quarter, self.vector_store, state.on_token)
             else:
-                result = self.qa_tool.answer_general_question(question, self.vector_store)
+                result = tool.answer_general_question(question, self.vector_store, state.on_token)
             
-            state["analysis_result"] = result
+            state.analysis_result = result
             return state
             
         except Exception as e:
-            state["error"] = f"Error in QA analysis: {str(e)}"
+            state.error = f"Error in QA analysis: {str(e)}"
             return state
     
-    def _format_response(self, state: Dict[str, Any]) -> Dict[str, Any]:
+    # Each request runs exactly one analysis, so dispatch directly; built once
+    # per class rather than per agent
+    _HANDLERS = {
+        "insight": _run_insight_analysis,
+        "compare": _run_compare_analysis,
+        "risk": _run_risk_analysis,
+        "qa": _run_qa_analysis,
+    }
+    
+    def _format_response(self, state: AnalysisState) -> AnalysisState:
         """Format the final response."""
-        analysis_type = state.get("analysis_type", "qa")
-        analysis_result = state.get("analysis_result", {})
-        error = state.get("error")
+        analysis_type = state.analysis_type
+        analysis_result = state.analysis_result
+        error = state.error
         
         if error:
-            state["response"] = {
+            state.response = {
                 "status": "error",
                 "message": error,
                 "analysis_type": analysis_type
             }
         else:
-            state["response"] = {
+            state.response = {
                 "status": "success",
                 "analysis_type": analysis_type,
                 "result": analysis_result
@@ -195,24 +210,58 @@ class AnalystGPTAgent:
     
     def run_analysis(self, analysis_type: str, **kwargs) -> Dict[str, Any]:
         """Run analysis with the specified type and parameters."""
-        # Prepare initial state
-        state = {
-            "analysis_type": analysis_type,
-            **kwargs
-        }
+        # Prepare initial state; unrecognised parameters are ignored, as with the old dict state
+        params = {key: value for key, value in kwargs.items() if key in _STATE_FIELDS}
+        state = AnalysisState(**params, analysis_type=analysis_type)
+        
+        # Unknown types fall back to QA
+        handler = self._HANDLERS.get(analysis_type, AnalystGPTAgent._run_qa_analysis)
+        state = self._format_response(handler(self, state))
+        
+        return state.response or {"status": "error", "message": "Unknown error"}
+    
+    async def arun_analysis(self, analysis_type: str, **kwargs) -> Dict[str, Any]:
+        """Async variant of run_analysis that keeps the event loop free.
+        
+        The tools and vector store are synchronous, so the analysis runs on
+        the loop's default executor and several requests can be awaited
+        concurrently.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(self.run_analysis, analysis_type, **kwargs))
+    
+    async def arun_document_analyses(self, documents: List, question: str = None,
+                                     max_concurrency: int = constants.LLM_MAX_CONCURRENCY) -> Dict[str, Dict[str, Any]]:
+        """Run insight, risk and (given a question) Q&A analysis of the same documents concurrently.
         
-        # Run the graph
-        result = self.graph.invoke(state)
+        Returns the tool results keyed by analysis type. The calls overlap, so
+        the total wait is the slowest call rather than the sum; the semaphore
+        keeps the fan-out within the Gemini rate limit. Transient 429s are
+        retried by the chat model client itself.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def limited(coro):
+            async with semaphore:
+                return await coro
+        
+        jobs = {
+            "insight": self._get_tool("insight").agenerate_insights(documents),
+            "risk": self._get_tool("risk").aanalyze_risks(documents),
+        }
+        if question:
+            jobs["qa"] = self._get_tool("qa").aanswer_question(question, documents)
         
-        return result.get("response", {"status": "error", "message": "Unknown error"})
+        results = await asyncio.gather(*(limited(job) for job in jobs.values()))
+        return dict(zip(jobs, results))
     
     def get_available_companies(self) -> List[str]:
         """Get list of available companies."""
-        return self.vector_store.get_all_companies()
+        return self._cached("companies", self.vector_store.get_all_companies)
     
     def get_available_quarters(self) -> List[Dict[str, str]]:
         """Get list of available quarters."""
-        return self.vector_store.get_all_quarters()
+        return self._cached("quarters", self.vector_store.get_all_quarters)
     
     def get_store_stats(self) -> Dict[str, Any]:
         """Get vector store statistics."""
@@ -1,49 +1,101 @@
 import os
 import re
+import logging
+import multiprocessing
 import fitz  # PyMuPDF
-from typing import List, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain, repeat
+from typing import List, Dict, Any, Tuple, Iterator
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
 import constants
 
+logger = logging.getLogger(__name__)
+
+# Filename substrings for each company, compiled into one alternation with a
+# named group per company
+_COMPANY_PATTERNS = {
+    'Apple': ['apple', 'aapl'],
+    'Google': ['google', 'alphabet', 'googl'],
+    'Microsoft': ['microsoft', 'msft'],
+    'Amazon': ['amazon', 'amzn'],
+    'Tesla': ['tesla', 'tsla'],
+    'Netflix': ['netflix', 'nflx'],
+    'Meta': ['meta', 'facebook', 'fb'],
+    'Nvidia': ['nvidia', 'nvda'],
+}
+_COMPANY_RE = re.compile("|".join(
+    f"(?P<{company.lower()}>{'|'.join(map(re.escape, patterns))})"
+    for company, patterns in _COMPANY_PATTERNS.items()
+), re.IGNORECASE)
+_COMPANY_BY_GROUP = {company.lower(): company for company in _COMPANY_PATTERNS}
+
+# Not anchored with \b: underscores are word characters, so names like
+# "aapl_2023_q1" would not match
+_YEAR_RE = re.compile(r'20\d{2}')
+_QUARTER_RE = re.compile(r'Q[1-4]', re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def _parse_filename(filename: str) -> Tuple[str, str, str]:
+    """(company, year, quarter) for a filename; pure, so memoized per name."""
+    company_match = _COMPANY_RE.search(filename)
+    company_name = _COMPANY_BY_GROUP[company_match.lastgroup] if company_match else "Unknown"
+    
+    year_match = _YEAR_RE.search(filename)
+    year = year_match.group() if year_match else "Unknown"
+    
+    quarter_match = _QUARTER_RE.search(filename)
+    quarter = quarter_match.group().upper() if quarter_match else "Unknown"
+    
+    return company_name, year, quarter
+
+# Common financial report sections, matched in a single pass; the earliest
+# occurrence on the page wins
+_SECTION_RE = re.compile("|".join(map(re.escape, [
+    "executive summary", "management discussion", "financial highlights",
+    "risk factors", "business overview", "results of operations",
+    "liquidity and capital resources", "market risk", "legal proceedings"
+])), re.IGNORECASE)
+
+# Plain text for embedding: clip to the page, join hyphenated line breaks, and
+# skip ligature/whitespace preservation and image placeholders
+_TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP | fitz.TEXT_DEHYPHENATE
+
+def _page_text(page) -> str:
+    return page.get_text("text", flags=_TEXT_FLAGS)
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Extract a contiguous range of pages in a worker process.
+    
+    Each worker opens the file once for its whole range (fitz documents
+    cannot be pickled), so the xref/trailer parse is paid once per worker.
+    """
+    doc = fitz.open(file_path)
+    try:
+        return [(page_num, _page_text(doc.load_page(page_num))) for page_num in range(start, stop)]
+    finally:
+        doc.close()
+        # Don't let MuPDF's warning buffer grow across files in a long-lived worker
+        fitz.TOOLS.mupdf_warnings(reset=True)
+
 class DocumentIngester:
-    def __init__(self):
+    def __init__(self, page_workers: int = 1):
+        # Processes used for page extraction on very large PDFs. Serial by
+        # default: starting spawn workers takes seconds, longer than reading
+        # a typical filing, so only opt in for bulk jobs on huge documents
+        self.page_workers = max(page_workers, 1)
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=constants.CHUNK_SIZE,
             chunk_overlap=constants.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", ". ", " ", ""]
+            separators=["\n\n", "\n", ". ", " ", ""],
+            is_separator_regex=False
         )
     
     def extract_company_info(self, filename: str) -> Dict[str, str]:
         """Extract company name, year, quarter from filename or content."""
-        # Try to extract from filename first
-        filename_lower = filename.lower()
-        
-        # Common company patterns
-        company_patterns = {
-            'apple': ['apple', 'aapl'],
-            'google': ['google', 'alphabet', 'googl'],
-            'microsoft': ['microsoft', 'msft'],
-            'amazon': ['amazon', 'amzn'],
-            'tesla': ['tesla', 'tsla'],
-            'netflix': ['netflix', 'nflx'],
-            'meta': ['meta', 'facebook', 'fb'],
-            'nvidia': ['nvidia', 'nvda']
-        }
-        
-        company_name = "Unknown"
-        for company, patterns in company_patterns.items():
-            if any(pattern in filename_lower for pattern in patterns):
-                company_name = company.title()
-                break
-        
-        # Extract year and quarter
-        year_match = re.search(r'20\d{2}', filename)
-        year = year_match.group() if year_match else "Unknown"
-        
-        quarter_match = re.search(r'Q[1-4]', filename, re.IGNORECASE)
-        quarter = quarter_match.group().upper() if quarter_match else "Unknown"
-        
+        company_name, year, quarter = _parse_filename(filename)
         return {
             "company_name": company_name,
             "year": year,
@@ -52,98 +104,150 @@ class DocumentIngester:
     
     def extract_section_info(self, text: str, page_num: int) -> str:
         """Extract section information from text."""
-        # Common financial report sections
-        sections = [
-            "executive summary", "management discussion", "financial highlights",
-            "risk factors", "business overview", "results of operations",
-            "liquidity and capital resources", "market risk", "legal proceedings"
-        ]
-        
-        text_lower = text.lower()
-        for section in sections:
-            if section in text_lower:
-                return section.replace(" ", "_")
+        match = _SECTION_RE.search(text)
+        if match:
+            return match.group().lower().replace(" ", "_")
         
         return f"page_{page_num}"
     
     def process_pdf(self, file_path: str) -> List[Document]:
         """Process a PDF file and return structured chunks."""
+        return list(self.iter_pdf_chunks(file_path))
+    
+    def iter_pdf_chunks(self, file_path: str) -> Iterator[Document]:
+        """Yield structured chunks from a PDF file."""
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"File not found: {file_path}")
         
         # Extract basic info from filename
         filename = os.path.basename(file_path)
         company_info = self.extract_company_info(filename)
-        print(f"🔍 Processing file: {file_path}")
-        print(f"📂 Company Info: {company_info}")
-        print(f"[DEBUG] Processing file: {filename}")
-        print(f"[DEBUG] Extracted company info: {company_info}")
+        logger.info("Processing file %s: %s", file_path, company_info)
         
-        # Open PDF and extract text
-        doc = fitz.open(file_path)
-        chunks = []
-        chunk_index = 0
+        page_texts = []
+        page_metadatas = []
         
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            text = page.get_text()
-            print(f"📄 Page {page_num+1}: {len(text)} characters extracted")
-            print(f"[DEBUG] Page {page_num + 1}: Extracted {len(text)} characters")
-            
+        for page_num, text in self._extract_pages(file_path):
             if not text.strip():
-                print("⚠️ Empty page skipped")
-                print(f"[DEBUG] Page {page_num + 1} is empty. Skipping.")
-
+                logger.debug("Page %d is empty, skipping", page_num + 1)
                 continue
             
             # Extract section info
             section = self.extract_section_info(text, page_num)
-            print(f"[DEBUG] Extracted section: {section}")
+            logger.debug("Page %d section: %s", page_num + 1, section)
             
-            # Split text into chunks
-            page_chunks = self.text_splitter.split_text(text)
-            print(f"[DEBUG] Split into {len(page_chunks)} chunks")
+            page_texts.append(text)
+            page_metadatas.append({
+                **company_info,
+                "section": section,
+                "source_file": filename,
+                "page_number": page_num + 1
+            })
+        
+        # Pages that fit in one chunk come back from the splitter as their
+        # stripped text, so only longer pages go through it (in one call)
+        long_pages = [i for i, text in enumerate(page_texts) if len(text) > constants.CHUNK_SIZE]
+        split_docs = defaultdict(list)
+        for doc in self.text_splitter.create_documents([page_texts[i] for i in long_pages],
+                                                       metadatas=[page_metadatas[i] for i in long_pages]):
+            split_docs[doc.metadata["page_number"]].append(doc)
+        
+        chunk_index = 0
+        for text, metadata in zip(page_texts, page_metadatas):
+            if len(text) > constants.CHUNK_SIZE:
+                page_docs = split_docs[metadata["page_number"]]
+            else:
+                page_docs = [Document(page_content=text.strip(), metadata=metadata)]
             
-            for i, chunk_text in enumerate(page_chunks):
-                if not chunk_text.strip():
+            for doc in page_docs:
+                if not doc.page_content.strip():
                     continue
-                
-                # Create metadata
-                metadata = {
-                    **company_info,
-                    "section": section,
-                    "source_file": filename,
-                    "page_number": page_num + 1,
-                    "chunk_index": chunk_index
-                }
-                
-                # Create Document object
-                doc_chunk = Document(
-                    page_content=chunk_text,
-                    metadata=metadata
-                )
-                
-                chunks.append(doc_chunk)
+                doc.metadata["chunk_index"] = chunk_index
                 chunk_index += 1
+                yield doc
+        logger.debug("Split %d pages into %d chunks (%d needed splitting)",
+                     len(page_texts), chunk_index, len(long_pages))
+    
+    def _extract_pages(self, file_path: str) -> List[Tuple[int, str]]:
+        """Extract the text of every page as (page_num, text), in page order.
         
-        doc.close()
-        return chunks
+        With page_workers > 1, PDFs with at least PARALLEL_PAGE_THRESHOLD
+        pages are split into page ranges across worker processes that each
+        reopen the file; PyMuPDF documents must not be shared between
+        threads. Everything else is read serially, where process startup
+        would cost more than it saves.
+        """
+        doc = fitz.open(file_path)
+        
+        try:
+            page_count = len(doc)
+            parallel = self.page_workers > 1 and page_count >= constants.PARALLEL_PAGE_THRESHOLD
+            if not parallel:
+                pages = [(page_num, _page_text(doc.load_page(page_num))) for page_num in range(page_count)]
+        finally:
+            doc.close()
+        
+        if parallel:
+            max_workers = min(self.page_workers, page_count)
+            # One contiguous, near-equal range of pages per worker
+            bounds = [page_count * i // max_workers for i in range(max_workers + 1)]
+            with ProcessPoolExecutor(max_workers=max_workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                ranges = executor.map(_extract_page_range, repeat(file_path), bounds[:-1], bounds[1:])
+                pages = list(chain.from_iterable(ranges))
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            for page_num, text in pages:
+                logger.debug("Page %d: %d characters extracted", page_num + 1, len(text))
+        
+        return pages
     
     def process_directory(self, directory_path: str) -> List[Document]:
         """Process all PDF files in a directory."""
-        all_chunks = []
+        return list(self.iter_directory_chunks(directory_path))
+    
+    def iter_directory_chunks(self, directory_path: str) -> Iterator[Document]:
+        """Yield chunks from every PDF in a directory, one file at a time.
         
-        for filename in os.listdir(directory_path):
-            if filename.lower().endswith('.pdf'):
-                file_path = os.path.join(directory_path, filename)
-                try:
-                    chunks = self.process_pdf(file_path)
-                    all_chunks.extend(chunks)
-                    print(f"Processed {filename}: {len(chunks)} chunks")
-                except Exception as e:
-                    print(f"Error processing {filename}: {str(e)}")
+        Only the current file's chunks are held in memory, so callers can
+        embed as they go. Files that fail are logged and skipped.
+        """
+        with os.scandir(directory_path) as entries:
+            pdf_entries = [entry for entry in entries
+                           if entry.name.lower().endswith('.pdf') and entry.is_file()]
         
-        return all_chunks
+        for entry in pdf_entries:
+            try:
+                chunks = self.process_pdf(entry.path)
+            except Exception as e:
+                logger.error("Error processing %s: %s", entry.name, e)
+                continue
+            logger.info("Processed %s: %d chunks", entry.name, len(chunks))
+            yield from chunks
+
+# One ingester per worker process, reused for every file the process handles.
+# File workers already run in parallel, so they extract pages serially.
+_worker_ingester = None
+
+def _get_worker_ingester() -> "DocumentIngester":
+    global _worker_ingester
+    if _worker_ingester is None:
+        _worker_ingester = DocumentIngester(page_workers=1)
+    return _worker_ingester
+
+def process_pdf_worker(file_path: str, ingester: "DocumentIngester" = None) -> Dict[str, Any]:
+    """Process a single PDF, typically in a worker process.
+
+    Workers build their own ingester once per process, so no state is shared
+    between processes. Errors are returned in the status dict instead of
+    raised so one bad file does not abort the whole batch.
+    """
+    ingester = ingester or _get_worker_ingester()
+    try:
+        chunks = ingester.process_pdf(file_path)
+        return {"file_path": file_path, "chunks": chunks, "error": None}
+    except Exception as e:
+        return {"file_path": file_path, "chunks": [], "error": str(e)}
 
 # Example usage
 if __name__ == "__main__":
@@ -6,80 +6,47 @@ This script tests the core functionality without requiring actual PDF documents.
 
 import os
 import sys
+import shutil
+import hashlib
+import tempfile
+import importlib
 from typing import List
 from langchain.schema import Document
+from langchain_core.embeddings import Embeddings
 
 # Add the analystgpt directory to the path
 sys.path.append('analystgpt')
 
+# (module, attribute that must exist) checked by test_imports
+MODULES = [
+    ("constants", None),
+    ("ingest", "DocumentIngester"),
+    ("vector_store", "VectorStore"),
+    ("tools.insight_tool", "InsightTool"),
+    ("tools.compare_tool", "CompareTool"),
+    ("tools.risk_tool", "RiskTool"),
+    ("tools.pdf_qa_tool", "PDFQATool"),
+    ("exports.excel_export", "ExcelExporter"),
+    ("exports.pdf_export", "PDFExporter"),
+]
+
 def test_imports():
     """Test that all modules can be imported."""
     print("Testing imports...")
     
-    try:
-        import constants
-        print("✓ constants.py imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing constants.py: {e}")
-        return False
-    
-    try:
-        from ingest import DocumentIngester
-        print("✓ DocumentIngester imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing DocumentIngester: {e}")
-        return False
-    
-    try:
-        from vector_store import VectorStore
-        print("✓ VectorStore imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing VectorStore: {e}")
-        return False
-    
-    try:
-        from tools.insight_tool import InsightTool
-        print("✓ InsightTool imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing InsightTool: {e}")
-        return False
-    
-    try:
-        from tools.compare_tool import CompareTool
-        print("✓ CompareTool imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing CompareTool: {e}")
-        return False
-    
-    try:
-        from tools.risk_tool import RiskTool
-        print("✓ RiskTool imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing RiskTool: {e}")
-        return False
-    
-    try:
-        from tools.pdf_qa_tool import PDFQATool
-        print("✓ PDFQATool imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing PDFQATool: {e}")
-        return False
-    
-    try:
-        from exports.excel_export import ExcelExporter
-        print("✓ ExcelExporter imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing ExcelExporter: {e}")
-        return False
-    
-    try:
-        from exports.pdf_export import PDFExporter
-        print("✓ PDFExporter imported successfully")
-    except Exception as e:
-        print(f"✗ Error importing PDFExporter: {e}")
-        return False
+    ok = True
+    for module_name, attr in MODULES:
+        label = attr or f"{module_name}.py"
+        try:
+            module = importlib.import_module(module_name)
+            if attr:
+                getattr(module, attr)
+            print(f"✓ {label} imported successfully")
+        except Exception as e:
+            print(f"✗ Error importing {label}: {e}")
+            ok = False
     
-    return True
+    return ok
 
 def test_constants():
     """Test constants configuration."""
@@ -144,6 +111,219 @@ def test_vector_store():
         print(f"✗ Error testing vector store: {e}")
         return False
 
+class StubEmbeddings(Embeddings):
+    """Deterministic unit vectors derived from the text, so no API calls are made."""
+    
+    def _embed(self, text: str) -> List[float]:
+        import numpy as np
+        rng = np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16))
+        vector = rng.normal(size=16)
+        return (vector / np.linalg.norm(vector)).tolist()
+    
+    def embed_documents(self, texts: List[str], **kwargs) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+    
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+def make_stub_vector_store(db_path: str):
+    """VectorStore on db_path that embeds with StubEmbeddings; no API key is needed."""
+    import constants
+    import vector_store
+    
+    original_embeddings = vector_store.GoogleGenerativeAIEmbeddings
+    original_load_config = constants.load_config
+    vector_store.GoogleGenerativeAIEmbeddings = lambda **kwargs: StubEmbeddings()
+    constants.load_config = lambda: constants.Config(google_api_key="test-key")
+    try:
+        return vector_store.VectorStore(db_path)
+    finally:
+        vector_store.GoogleGenerativeAIEmbeddings = original_embeddings
+        constants.load_config = original_load_config
+
+def make_test_documents(count: int) -> List[Document]:
+    companies = ["Apple", "Google"]
+    return [
+        Document(
+            page_content=f"{companies[i % 2]} reported revenue growth in filing chunk {i}.",
+            metadata={"company_name": companies[i % 2], "year": "2023", "quarter": f"Q{1 + i % 2}",
+                      "section": "page_1", "source_file": f"{companies[i % 2]}.pdf", "chunk_index": i}
+        )
+        for i in range(count)
+    ]
+
+def test_vector_store_migration():
+    """Test that a store saved by FAISS.save_local moves onto the SQLite docstore intact."""
+    print("\nTesting vector store migration...")
+    
+    db_path = tempfile.mkdtemp()
+    try:
+        from langchain_community.vectorstores import FAISS
+        import vector_store
+        
+        test_docs = make_test_documents(8)
+        legacy = FAISS.from_documents(test_docs, StubEmbeddings())
+        legacy.save_local(db_path)
+        expected = [legacy.docstore.search(legacy.index_to_docstore_id[i]) for i in range(len(test_docs))]
+        expected_results = legacy.similarity_search("Apple revenue", k=3)
+        
+        store = make_stub_vector_store(db_path)
+        if os.path.exists(os.path.join(db_path, vector_store.LEGACY_DOCSTORE_FILE)):
+            print("✗ Legacy docstore pickle was not removed")
+            return False
+        
+        migrated = store.vector_store
+        for i, doc in enumerate(expected):
+            doc_id = legacy.index_to_docstore_id[i]
+            row = migrated.docstore.search(doc_id)
+            if migrated.index_to_docstore_id[i] != doc_id or not isinstance(row, Document) \
+                    or row.page_content != doc.page_content or row.metadata != doc.metadata:
+                print(f"✗ Document {i} did not round-trip through the migration")
+                return False
+        print(f"✓ {len(expected)} document ids, texts and metadata migrated")
+        
+        results = store.similarity_search("Apple revenue", k=3)
+        if [doc.page_content for doc in results] != [doc.page_content for doc in expected_results]:
+            print("✗ Search results changed after migration")
+            return False
+        print("✓ Search results match the legacy store")
+        
+        # A second load reads the SQLite docstore rather than migrating again
+        reloaded = make_stub_vector_store(db_path)
+        if reloaded.get_store_stats()["total_documents"] != len(test_docs):
+            print("✗ Migrated store did not reload")
+            return False
+        print("✓ Migrated store reloads from SQLite")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ Error testing vector store migration: {e}")
+        return False
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def test_vector_store_truncation():
+    """Test that docstore rows committed without their index are dropped on load."""
+    print("\nTesting vector store truncation...")
+    
+    db_path = tempfile.mkdtemp()
+    try:
+        test_docs = make_test_documents(10)
+        store = make_stub_vector_store(db_path)
+        store.add_documents(test_docs[:6])
+        store.flush()
+        
+        # Rows for these documents reach SQLite, but the index on disk is not rewritten
+        store.add_documents(test_docs[6:])
+        store.vector_store.docstore.commit()
+        
+        reloaded = make_stub_vector_store(db_path)
+        faiss_store = reloaded.vector_store
+        counts = {
+            "total_documents": reloaded.get_store_stats()["total_documents"],
+            "index": faiss_store.index.ntotal,
+            "id_map": len(faiss_store.index_to_docstore_id),
+            "docstore_rows": sum(1 for _ in faiss_store.docstore.iter_documents()),
+        }
+        if set(counts.values()) != {6}:
+            print(f"✗ Expected 6 documents after reload, found {counts}")
+            return False
+        print("✓ Rows beyond the saved index were truncated")
+        
+        # New documents take the positions freed by the truncation
+        reloaded.add_documents(test_docs[6:7])
+        reloaded.flush()
+        again = make_stub_vector_store(db_path).vector_store
+        last = again.docstore.search(again.index_to_docstore_id[6])
+        if again.index.ntotal != 7 or last.page_content != test_docs[6].page_content:
+            print("✗ Document added after truncation is not at the next position")
+            return False
+        print("✓ Documents added after truncation line up with the index")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ Error testing vector store truncation: {e}")
+        return False
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def test_semantic_cache():
+    """Test semantic cache hits, expiry, eviction and statistics."""
+    print("\nTesting semantic cache...")
+    
+    from types import SimpleNamespace
+    from cache import semantic_cache
+    
+    original_time = semantic_cache.time
+    clock = [1000.0]
+    semantic_cache.time = SimpleNamespace(time=lambda: clock[0])
+    try:
+        vectors = {
+            "apple revenue": [1.0, 0.0, 0.0],
+            "apple sales": [0.95, 0.31, 0.0],  # cosine ~0.95 with "apple revenue"
+            "apple risks": [0.0, 1.0, 0.0],
+        }
+        cache = semantic_cache.SemanticCache(vectors.__getitem__, threshold=0.9,
+                                             ttl_seconds=60, max_entries=2)
+        scope = ("qa", "Apple", "2023", "Q1")
+        
+        result, embedding = cache.lookup(scope, "apple revenue")
+        if result is not None:
+            print("✗ Empty cache returned a result")
+            return False
+        cache.set(scope, {"answer": "revenue"}, embedding)
+        
+        if cache.lookup(scope, "apple sales")[0] != {"answer": "revenue"}:
+            print("✗ Similar query above the threshold missed")
+            return False
+        if cache.lookup(scope, "apple risks")[0] is not None:
+            print("✗ Dissimilar query below the threshold hit")
+            return False
+        if cache.lookup(("qa", "Google", "2023", "Q1"), "apple revenue")[0] is not None:
+            print("✗ Query hit an entry from another scope")
+            return False
+        print("✓ Hits above the threshold, misses below it and across scopes")
+        
+        clock[0] += 61
+        if cache.lookup(scope, "apple revenue")[0] is not None:
+            print("✗ Expired entry was returned")
+            return False
+        print("✓ Entries expire after the TTL")
+        
+        for i in range(3):
+            cache.set(("insight", f"Company{i}", "2023", "Q1"), {"insights": i})
+        if cache.lookup(("insight", "Company0", "2023", "Q1"))[0] is not None \
+                or cache.lookup(("insight", "Company2", "2023", "Q1"))[0] != {"insights": 2}:
+            print("✗ Oldest entry was not evicted at max_entries")
+            return False
+        print("✓ Oldest entries are evicted at max_entries")
+        
+        stats = cache.get_stats()
+        if stats != {"entries": 2, "hits": 2, "misses": 5, "hit_rate": 2 / 7}:
+            print(f"✗ Unexpected cache statistics: {stats}")
+            return False
+        cache.clear()
+        if cache.get_stats()["entries"] != 0 or cache.lookup(("insight", "Company2", "2023", "Q1"))[0] is not None:
+            print("✗ clear() left entries behind")
+            return False
+        print("✓ Statistics and clear() are correct")
+        
+        cache.set(scope, {"answer": "revenue"})
+        if cache.lookup(scope, "unknown question") != (None, None):
+            print("✗ Failed query embedding did not fall through uncached")
+            return False
+        print("✓ Embedding errors fall through to an uncached analysis")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ Error testing semantic cache: {e}")
+        return False
+    finally:
+        semantic_cache.time = original_time
+
 def test_tools():
     """Test analysis tools."""
     print("\nTesting analysis tools...")
@@ -231,6 +411,9 @@ def main():
         ("Import Test", test_imports),
         ("Constants Test", test_constants),
         ("Vector Store Test", test_vector_store),
+        ("Vector Store Migration Test", test_vector_store_migration),
+        ("Vector Store Truncation Test", test_vector_store_truncation),
+        ("Semantic Cache Test", test_semantic_cache),
         ("Tools Test", test_tools),
         ("Export Test", test_exports)
     ]
@@ -0,0 +1,124 @@
+import re
+import logging
+from functools import lru_cache
+from typing import List, Tuple
+from langchain.schema import Document
+import constants
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_HEADER = "Document {i}: {company_name} - {year} {quarter} - {section}"
+
+# Lines repeated on every page of a filing: copyright notices and page labels
+# such as "Page 3", "3 of 12" or "- 3 -". Bare numbers are kept (table cells).
+_BOILERPLATE_RE = re.compile(
+    r'^[ \t]*(?:(?:©|\(c\)|copyright\b).*'
+    r'|page\s+\d+(?:\s+of\s+\d+)?'
+    r'|\d+\s+of\s+\d+'
+    r'|-\s*\d+\s*-)[ \t]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+_WHITESPACE_RE = re.compile(r'\s+')
+# Drops NULs and other control characters PyMuPDF can emit, and turns \r into \n
+# so the line-anchored boilerplate pattern also matches CRLF text
+_CONTROL_CHARS = str.maketrans({**dict.fromkeys(set(range(32)) - {9, 10, 11, 12}), 13: "\n"})
+_DEDUPE_PREFIX = 512  # Characters compared when detecting repeated chunks
+
+class _Metadata(dict):
+    def __missing__(self, key):
+        return "Unknown"
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    """tiktoken encoding for token counts, or None if it cannot be loaded.
+
+    The encoding file is downloaded on first use, so this fails offline.
+    """
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(constants.TOKENIZER_ENCODING)
+    except Exception as e:
+        logger.warning("Token counts fall back to a character estimate: %s", e)
+        return None
+
+def estimate_tokens(text: str) -> int:
+    """Token count of text with tiktoken, or about 4 characters per token without it.
+
+    cl100k_base is not Gemini's tokenizer but tracks it closely enough for budgeting.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode_ordinary(text))
+
+def compress_text(text: str) -> str:
+    """Drop control characters and boilerplate lines, and collapse whitespace to single spaces."""
+    return _WHITESPACE_RE.sub(" ", _BOILERPLATE_RE.sub("", text.translate(_CONTROL_CHARS))).strip()
+
+def prepare_context(documents: List[Document], max_chars: int = 1000,
+                    token_budget: int = constants.CONTEXT_TOKEN_BUDGET,
+                    header: str = DOCUMENT_HEADER) -> Tuple[str, List[Document]]:
+    """Prepare prompt context from documents, one labelled block per document.
+
+    Chunk text is compressed first, and chunks whose opening text repeats an
+    earlier one (the same passage filed in several places) are skipped.
+    Documents are taken in retrieval order until the next block would exceed
+    token_budget, so the most relevant chunks are the ones kept. header is
+    formatted with the block number {i} and the document metadata.
+    
+    Returns the context and the documents it includes, so results can
+    report what the model actually saw.
+    """
+    parts = []
+    used_docs = []
+    seen = set()
+    used = 0
+    saved = 0
+    # Counting the uncompressed text costs a second encode, so only for debug logs
+    track_saved = logger.isEnabledFor(logging.DEBUG)
+
+    for doc in documents:
+        content = compress_text(doc.page_content)
+        key = content[:_DEDUPE_PREFIX].lower()
+        if not content or key in seen:
+            if track_saved:
+                saved += estimate_tokens(doc.page_content[:max_chars])
+            continue
+        seen.add(key)
+
+        meta = _Metadata(doc.metadata, i=len(parts) + 1)
+        # Slicing a string that is already short enough returns it uncopied
+        part = f"{header.format_map(meta)}\n{content[:max_chars]}\n"
+        tokens = estimate_tokens(part)
+        if used + tokens > token_budget:
+            break
+        used += tokens
+        if track_saved:
+            saved += estimate_tokens(doc.page_content[:max_chars]) - estimate_tokens(content[:max_chars])
+        parts.append(part)
+        used_docs.append(doc)
+
+    if track_saved:
+        logger.debug("Context: %d of %d documents, ~%d tokens, input_tokens_saved ~%d",
+                     len(parts), len(documents), used, max(saved, 0))
+    return "\n".join(parts), used_docs
+
+def dedupe_documents(documents: List[Document]) -> List[Document]:
+    """Drop repeated chunks, keeping the first occurrence (retrieval order).
+
+    Chunks are identified by (source_file, chunk_index) from ingestion, or by
+    their text when no chunk index is present.
+    """
+    seen = set()
+    unique = []
+
+    for doc in documents:
+        meta = doc.metadata
+        chunk_index = meta.get("chunk_index")
+        key = (meta.get("source_file"), chunk_index if chunk_index is not None else doc.page_content)
+        if key in seen:
+            continue
+        seen.add(key)
+        unique.append(doc)
+
+    return unique
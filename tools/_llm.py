@@ -0,0 +1,20 @@
+from functools import lru_cache
+from typing import Optional
+from langchain_google_genai import ChatGoogleGenerativeAI
+import constants
+
+def get_llm(model: Optional[str] = None) -> ChatGoogleGenerativeAI:
+    """Chat model for model, shared by the agent and every tool in the process.
+
+    model defaults to the configured Gemini model. One instance per model means one underlying Gemini client and connection,
+    reused across analyses instead of being set up again per tool.
+    """
+    return _cached_llm(model or constants.load_config().gemini_model)
+
+@lru_cache(maxsize=None)
+def _cached_llm(model: str) -> ChatGoogleGenerativeAI:
+    return ChatGoogleGenerativeAI(
+        model=model,
+        google_api_key=constants.load_config().google_api_key,
+        temperature=0.1
+    )
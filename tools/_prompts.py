@@ -0,0 +1,14 @@
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+# Resolved once at import, relative to the package rather than the working directory
+PROMPT_DIR = Path(__file__).resolve().parent.parent / "prompts"
+
+@lru_cache(maxsize=None)
+def load_prompt(name: str) -> Optional[str]:
+    """Read a prompt template from prompts/ once per process; None if it is missing."""
+    try:
+        return (PROMPT_DIR / name).read_text()
+    except FileNotFoundError:
+        return None
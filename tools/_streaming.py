@@ -0,0 +1,16 @@
+from typing import Callable, Optional
+
+def generate(llm, prompt: str, on_token: Optional[Callable[[str], None]] = None) -> str:
+    """Return the model's full response text.
+
+    With on_token, the response is streamed and each piece is passed to the
+    callback as it arrives, so callers can render it before generation ends.
+    """
+    if on_token is None:
+        return llm.invoke(prompt).content
+
+    parts = []
+    for chunk in llm.stream(prompt):
+        parts.append(chunk.content)
+        on_token(chunk.content)
+    return "".join(parts)
@@ -1,35 +1,32 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable, Tuple
+import asyncio
 from langchain.schema import Document
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 import constants
+from tools._llm import get_llm
+from tools._streaming import generate
+from tools._prompts import load_prompt
+from tools._context import prepare_context
 
 class InsightTool:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model=constants.GEMINI_MODEL,
-            google_api_key=constants.GOOGLE_API_KEY,
-            temperature=0.1
-        )
+    def __init__(self, llm: Optional[ChatGoogleGenerativeAI] = None):
+        self.llm = llm or get_llm()
         self.prompt_template = PromptTemplate(
             input_variables=["context"],
             template=self._load_prompt_template()
         )
+        # The template is validated above; per-call formatting skips LangChain's checks
+        self._template = self.prompt_template.template
     
     def _load_prompt_template(self) -> str:
         """Load the insight prompt template."""
-        try:
-            with open("prompts/insight_prompt.txt", "r") as f:
-                return f.read()
-        except FileNotFoundError:
-            return self._get_default_prompt()
+        return load_prompt("insight_prompt.txt") or self._get_default_prompt()
     
     def _get_default_prompt(self) -> str:
         """Default prompt if template file is not found."""
         return """You are a senior financial analyst specializing in extracting key insights from earnings reports and financial documents. Your task is to analyze the provided document chunks and generate comprehensive business insights.
 
-Context: {context}
-
 Please provide a structured analysis with:
 1. Executive Summary (2-3 sentences)
 2. Key Financial Metrics (with specific numbers)
@@ -38,44 +35,98 @@ Please provide a structured analysis with:
 5. Risk Factors (if any significant ones mentioned)
 6. Outlook and Forward-Looking Statements
 
-Format your response in a professional, analytical tone suitable for investment decision-making."""
+Format your response in a professional, analytical tone suitable for investment decision-making.
+
+Context: {context}"""
     
-    def generate_insights(self, documents: List[Document]) -> Dict[str, Any]:
+    def generate_insights(self, documents: List[Document],
+                          on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Generate insights from the provided documents."""
         if not documents:
             return {"error": "No documents provided"}
         
-        # Prepare context from documents
-        context = self._prepare_context(documents)
-        
-        # Generate prompt
-        prompt = self.prompt_template.format(context=context)
+        prompt, used_docs = self._build_prompt(documents)
         
         try:
             # Generate response
-            response = self.llm.predict(prompt)
-            
-            return {
-                "insights": response,
-                "source_documents": len(documents),
-                "companies": list(set([doc.metadata.get("company_name", "Unknown") for doc in documents])),
-                "quarters": list(set([f"{doc.metadata.get('year', 'Unknown')} {doc.metadata.get('quarter', 'Unknown')}" for doc in documents]))
-            }
+            response = generate(self.llm, prompt, on_token)
+            return self._build_result(response, used_docs)
+        
+        except Exception as e:
+            return {"error": f"Error generating insights: {str(e)}"}
+    
+    async def agenerate_insights(self, documents: List[Document]) -> Dict[str, Any]:
+        """Async variant of generate_insights; awaits the model without blocking the loop."""
+        if not documents:
+            return {"error": "No documents provided"}
+        
+        prompt, used_docs = self._build_prompt(documents)
+        
+        try:
+            response = (await self.llm.ainvoke(prompt)).content
+            return self._build_result(response, used_docs)
         
         except Exception as e:
             return {"error": f"Error generating insights: {str(e)}"}
     
-    def generate_company_insights(self, company_name: str, vector_store) -> Dict[str, Any]:
+    async def generate_insights_stream(self, documents: List[Document]) -> AsyncIterator[str]:
+        """Yield the insights text piece by piece as the model produces it."""
+        if not documents:
+            return
+        
+        prompt, _ = self._build_prompt(documents)
+        async for chunk in self.llm.astream(prompt):
+            yield chunk.content
+    
+    def _build_prompt(self, documents: List[Document]) -> Tuple[str, List[Document]]:
+        """Prompt for documents, and the documents that made it into its context."""
+        context, used_docs = prepare_context(documents)
+        return self._template.format_map({"context": context}), used_docs
+    
+    def _build_result(self, response: str, documents: List[Document]) -> Dict[str, Any]:
+        return {
+            "insights": response,
+            "source_documents": len(documents),
+            "companies": list(set([doc.metadata.get("company_name", "Unknown") for doc in documents])),
+            "quarters": list(set([f"{doc.metadata.get('year', 'Unknown')} {doc.metadata.get('quarter', 'Unknown')}" for doc in documents]))
+        }
+    
+    def _fetch_company_documents(self, company_name: str, vector_store) -> List[Document]:
+        return vector_store.search_by_company(company_name, "financial performance", k=10)
+    
+    def generate_company_insights(self, company_name: str, vector_store,
+                                  on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Generate insights for a specific company."""
         # Search for documents from the company
-        documents = vector_store.search_by_company(company_name, "financial performance", k=10)
+        documents = self._fetch_company_documents(company_name, vector_store)
         
         if not documents:
             return {"error": f"No documents found for company: {company_name}"}
         
-        return self.generate_insights(documents)
+        return self.generate_insights(documents, on_token)
     
-    def generate_quarter_insights(self, year: str, quarter: str, vector_store) -> Dict[str, Any]:
+    async def generate_portfolio_insights(self, companies: List[str], vector_store,
+                                          max_concurrency: int = constants.LLM_MAX_CONCURRENCY) -> Dict[str, Dict[str, Any]]:
+        """Generate company insights for several companies at once, keyed by company.
+        
+        Retrieval is local and shares one cached query embedding, so only the
+        model calls are awaited; they overlap up to max_concurrency at a time.
+        """
+        companies = list(dict.fromkeys(companies))  # One call per company, even if listed twice
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def company_insights(company_name: str) -> Dict[str, Any]:
+            documents = self._fetch_company_documents(company_name, vector_store)
+            if not documents:
+                return {"error": f"No documents found for company: {company_name}"}
+            async with semaphore:
+                return await self.agenerate_insights(documents)
+        
+        results = await asyncio.gather(*(company_insights(company) for company in companies))
+        return dict(zip(companies, results))
+    
+    def generate_quarter_insights(self, year: str, quarter: str, vector_store,
+                                  on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Generate insights for a specific quarter."""
         # Search for documents from the quarter
         documents = vector_store.search_by_quarter(year, quarter, "financial performance", k=10)
@@ -83,24 +134,7 @@ Format your response in a professional, analytical tone suitable for investment
         if not documents:
             return {"error": f"No documents found for {year} {quarter}"}
         
-        return self.generate_insights(documents)
-    
-    def _prepare_context(self, documents: List[Document]) -> str:
-        """Prepare context from documents for analysis."""
-        context_parts = []
-        
-        for i, doc in enumerate(documents):
-            company = doc.metadata.get("company_name", "Unknown")
-            year = doc.metadata.get("year", "Unknown")
-            quarter = doc.metadata.get("quarter", "Unknown")
-            section = doc.metadata.get("section", "Unknown")
-            
-            header = f"Document {i+1}: {company} - {year} {quarter} - {section}"
-            content = doc.page_content[:1000]  # Limit content length
-            
-            context_parts.append(f"{header}\n{content}\n")
-        
-        return "\n".join(context_parts)
+        return self.generate_insights(documents, on_token)
 
 # Example usage
 if __name__ == "__main__":
@@ -1,30 +1,38 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Tuple
+from functools import cached_property
 from langchain.schema import Document
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 import constants
+from tools._llm import get_llm
+from tools._context import prepare_context
+from tools._streaming import generate
+
+SOURCE_HEADER = "Source {i}: {company_name} - {year} {quarter} - {section} (Page {page_number})"
 
 class PDFQATool:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model=constants.GEMINI_MODEL,
-            google_api_key=constants.GOOGLE_API_KEY,
-            temperature=0.1
-        )
+    def __init__(self, llm: Optional[ChatGoogleGenerativeAI] = None,
+                 fast_llm: Optional[ChatGoogleGenerativeAI] = None, route_by_size: bool = True):
+        self.llm = llm or get_llm()
+        # A caller that injects llm but not fast_llm gets llm for both routes
+        self._fast_llm = fast_llm or llm
+        self.route_by_size = route_by_size
         self.qa_prompt_template = PromptTemplate(
             input_variables=["question", "context"],
             template=self._get_qa_prompt()
         )
+        # The template is validated above; per-call formatting skips LangChain's checks
+        self._template = self.qa_prompt_template.template
+    
+    @cached_property
+    def fast_llm(self) -> ChatGoogleGenerativeAI:
+        """Model for small requests, created the first time routing selects it."""
+        return self._fast_llm or get_llm(constants.GEMINI_FAST_MODEL)
     
     def _get_qa_prompt(self) -> str:
         """Get the QA prompt template."""
         return """You are a financial analyst assistant. Answer the user's question based on the provided document context. 
 
-Question: {question}
-
-Context from documents:
-{context}
-
 Instructions:
 1. Answer the question based ONLY on the information provided in the context
 2. If the information is not available in the context, say "I don't have enough information to answer this question"
@@ -39,9 +47,15 @@ Please provide a clear, structured answer with:
 - Source information (company, period)
 - Any relevant caveats or limitations
 
-Format your response in a professional, analytical tone."""
+Format your response in a professional, analytical tone.
+
+Context from documents:
+{context}
+
+Question: {question}"""
     
-    def answer_question(self, question: str, documents: List[Document]) -> Dict[str, Any]:
+    def answer_question(self, question: str, documents: List[Document],
+                        on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Answer a specific question based on the provided documents."""
         if not documents:
             return {"error": "No documents provided"}
@@ -49,31 +63,56 @@ Format your response in a professional, analytical tone."""
         if not question.strip():
             return {"error": "No question provided"}
         
-        # Prepare context from documents
-        context = self._prepare_context(documents)
-        
-        # Generate prompt
-        prompt = self.qa_prompt_template.format(
-            question=question,
-            context=context
-        )
+        prompt, used_docs = self._build_prompt(question, documents)
         
         try:
             # Generate response
-            response = self.llm.predict(prompt)
-            
-            return {
-                "answer": response,
-                "question": question,
-                "source_documents": len(documents),
-                "companies": list(set([doc.metadata.get("company_name", "Unknown") for doc in documents])),
-                "quarters": list(set([f"{doc.metadata.get('year', 'Unknown')} {doc.metadata.get('quarter', 'Unknown')}" for doc in documents]))
-            }
+            response = generate(self._select_llm(question, documents), prompt, on_token)
+            return self._build_result(response, question, used_docs)
         
         except Exception as e:
             return {"error": f"Error answering question: {str(e)}"}
     
-    def answer_company_question(self, question: str, company_name: str, vector_store) -> Dict[str, Any]:
+    async def aanswer_question(self, question: str, documents: List[Document]) -> Dict[str, Any]:
+        """Async variant of answer_question; awaits the model without blocking the loop."""
+        if not documents:
+            return {"error": "No documents provided"}
+        
+        if not question.strip():
+            return {"error": "No question provided"}
+        
+        prompt, used_docs = self._build_prompt(question, documents)
+        
+        try:
+            response = (await self._select_llm(question, documents).ainvoke(prompt)).content
+            return self._build_result(response, question, used_docs)
+        
+        except Exception as e:
+            return {"error": f"Error answering question: {str(e)}"}
+    
+    def _build_prompt(self, question: str, documents: List[Document]) -> Tuple[str, List[Document]]:
+        """Prompt for the question, and the documents that made it into its context."""
+        context, used_docs = prepare_context(documents, max_chars=1200, header=SOURCE_HEADER)
+        return self._template.format_map({"question": question, "context": context}), used_docs
+    
+    def _select_llm(self, question: str, documents: List[Document]) -> ChatGoogleGenerativeAI:
+        """Fast model for a short question over a few chunks, otherwise the main model."""
+        if (self.route_by_size and len(documents) <= constants.FAST_QA_MAX_DOCUMENTS
+                and len(question) < constants.FAST_QA_MAX_QUESTION_CHARS):
+            return self.fast_llm
+        return self.llm
+    
+    def _build_result(self, response: str, question: str, documents: List[Document]) -> Dict[str, Any]:
+        return {
+            "answer": response,
+            "question": question,
+            "source_documents": len(documents),
+            "companies": list(set([doc.metadata.get("company_name", "Unknown") for doc in documents])),
+            "quarters": list(set([f"{doc.metadata.get('year', 'Unknown')} {doc.metadata.get('quarter', 'Unknown')}" for doc in documents]))
+        }
+    
+    def answer_company_question(self, question: str, company_name: str, vector_store,
+                                on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Answer a question about a specific company."""
         # Search for relevant documents from the company
         documents = vector_store.search_by_company(company_name, question, k=8)
@@ -81,9 +120,10 @@ Format your response in a professional, analytical tone."""
         if not documents:
             return {"error": f"No documents found for company: {company_name}"}
         
-        return self.answer_question(question, documents)
+        return self.answer_question(question, documents, on_token)
     
-    def answer_quarter_question(self, question: str, year: str, quarter: str, vector_store) -> Dict[str, Any]:
+    def answer_quarter_question(self, question: str, year: str, quarter: str, vector_store,
+                                on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Answer a question about a specific quarter."""
         # Search for relevant documents from the quarter
         documents = vector_store.search_by_quarter(year, quarter, question, k=8)
@@ -91,9 +131,10 @@ Format your response in a professional, analytical tone."""
         if not documents:
             return {"error": f"No documents found for {year} {quarter}"}
         
-        return self.answer_question(question, documents)
+        return self.answer_question(question, documents, on_token)
     
-    def answer_general_question(self, question: str, vector_store) -> Dict[str, Any]:
+    def answer_general_question(self, question: str, vector_store,
+                                on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Answer a general question across all documents."""
         # Search for relevant documents across all companies
         documents = vector_store.similarity_search(question, k=10)
@@ -101,25 +142,7 @@ Format your response in a professional, analytical tone."""
         if not documents:
             return {"error": "No relevant documents found"}
         
-        return self.answer_question(question, documents)
-    
-    def _prepare_context(self, documents: List[Document]) -> str:
-        """Prepare context from documents for QA."""
-        context_parts = []
-        
-        for i, doc in enumerate(documents):
-            company = doc.metadata.get("company_name", "Unknown")
-            year = doc.metadata.get("year", "Unknown")
-            quarter = doc.metadata.get("quarter", "Unknown")
-            section = doc.metadata.get("section", "Unknown")
-            page = doc.metadata.get("page_number", "Unknown")
-            
-            header = f"Source {i+1}: {company} - {year} {quarter} - {section} (Page {page})"
-            content = doc.page_content[:1200]  # Limit content length
-            
-            context_parts.append(f"{header}\n{content}\n")
-        
-        return "\n".join(context_parts)
+        return self.answer_question(question, documents, on_token)
     
     def suggest_questions(self, company_name: str = None, year: str = None, quarter: str = None) -> List[str]:
         """Suggest relevant questions based on available data."""
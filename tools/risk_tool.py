@@ -1,35 +1,54 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Tuple
+import asyncio
+from functools import cached_property
 from langchain.schema import Document
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import PromptTemplate
 import constants
+from tools._llm import get_llm
+from tools._streaming import generate
+from tools._prompts import load_prompt
+from tools._context import prepare_context
+
+# Substring checks; each `in` is a single C-level scan of the text
+_RISK_KEYWORDS = (
+    "risk", "uncertainty", "volatility", "exposure", "vulnerability",
+    "threat", "challenge", "adverse", "negative", "decline", "loss",
+    "litigation", "legal", "regulatory", "compliance", "penalty",
+    "cybersecurity", "data breach", "privacy", "security",
+    "supply chain", "disruption", "shortage", "inflation",
+    "interest rate", "currency", "exchange rate", "hedge",
+    "competition", "market share", "pricing pressure",
+    "technology", "innovation", "obsolescence", "disruption"
+)
 
 class RiskTool:
-    def __init__(self):
-        self.llm = ChatGoogleGenerativeAI(
-            model=constants.GEMINI_MODEL,
-            google_api_key=constants.GOOGLE_API_KEY,
-            temperature=0.1
-        )
+    def __init__(self, llm: Optional[ChatGoogleGenerativeAI] = None,
+                 fast_llm: Optional[ChatGoogleGenerativeAI] = None, route_by_size: bool = True):
+        self.llm = llm or get_llm()
+        # A caller that injects llm but not fast_llm gets llm for both routes
+        self._fast_llm = fast_llm or llm
+        self.route_by_size = route_by_size
         self.prompt_template = PromptTemplate(
             input_variables=["context"],
             template=self._load_prompt_template()
         )
+        # The template is validated above; per-call formatting skips LangChain's checks
+        self._template = self.prompt_template.template
+    
+    @cached_property
+    def fast_llm(self) -> ChatGoogleGenerativeAI:
+        """Model for small requests, created the first time routing selects it."""
+        return self._fast_llm or get_llm(constants.GEMINI_FAST_MODEL)
     
     def _load_prompt_template(self) -> str:
         """Load the risk prompt template."""
-        try:
-            with open("prompts/risk_prompt.txt", "r") as f:
-                return f.read()
-        except FileNotFoundError:
-            return self._get_default_prompt()
+        return load_prompt("risk_prompt.txt") or self._get_default_prompt()
     
     def _get_default_prompt(self) -> str:
         """Default prompt if template file is not found."""
         return """You are a risk analyst specializing in identifying and analyzing risk factors from financial documents. Your task is to analyze the provided document chunks and extract comprehensive risk information.
 
-Context: {context}
-
 Please provide a structured risk analysis with:
 1. Executive Summary of Key Risks (2-3 sentences)
 2. Identified Risk Categories (with specific examples)
@@ -38,62 +57,117 @@ Please provide a structured risk analysis with:
 5. Regulatory and Compliance Risks
 6. Forward-Looking Risk Statements
 
-Format your response in a professional, analytical tone suitable for risk assessment."""
+Format your response in a professional, analytical tone suitable for risk assessment.
+
+Context: {context}"""
     
-    def analyze_risks(self, documents: List[Document]) -> Dict[str, Any]:
+    def analyze_risks(self, documents: List[Document],
+                      on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Analyze risks from the provided documents."""
         if not documents:
             return {"error": "No documents provided"}
         
-        # Prepare context from documents
-        context = self._prepare_context(documents)
-        
-        # Generate prompt
-        prompt = self.prompt_template.format(context=context)
+        prompt, used_docs = self._build_prompt(documents)
         
         try:
             # Generate response
-            response = self.llm.predict(prompt)
-            
-            return {
-                "risk_analysis": response,
-                "source_documents": len(documents),
-                "companies": list(set([doc.metadata.get("company_name", "Unknown") for doc in documents])),
-                "quarters": list(set([f"{doc.metadata.get('year', 'Unknown')} {doc.metadata.get('quarter', 'Unknown')}" for doc in documents]))
-            }
+            response = generate(self._select_llm(documents), prompt, on_token)
+            return self._build_result(response, used_docs)
         
         except Exception as e:
             return {"error": f"Error analyzing risks: {str(e)}"}
     
-    def analyze_company_risks(self, company_name: str, vector_store) -> Dict[str, Any]:
-        """Analyze risks for a specific company."""
+    async def aanalyze_risks(self, documents: List[Document]) -> Dict[str, Any]:
+        """Async variant of analyze_risks; awaits the model without blocking the loop."""
+        if not documents:
+            return {"error": "No documents provided"}
+        
+        prompt, used_docs = self._build_prompt(documents)
+        
+        try:
+            response = (await self._select_llm(documents).ainvoke(prompt)).content
+            return self._build_result(response, used_docs)
+        
+        except Exception as e:
+            return {"error": f"Error analyzing risks: {str(e)}"}
+    
+    def _build_prompt(self, documents: List[Document]) -> Tuple[str, List[Document]]:
+        """Prompt for documents, and the documents that made it into its context."""
+        context, used_docs = prepare_context(documents)
+        return self._template.format_map({"context": context}), used_docs
+    
+    def _select_llm(self, documents: List[Document]) -> ChatGoogleGenerativeAI:
+        """Fast model when only a few chunks were retrieved, otherwise the main model."""
+        if self.route_by_size and len(documents) <= constants.FAST_RISK_MAX_DOCUMENTS:
+            return self.fast_llm
+        return self.llm
+    
+    def _build_result(self, response: str, documents: List[Document]) -> Dict[str, Any]:
+        return {
+            "risk_analysis": response,
+            "source_documents": len(documents),
+            "companies": list(set([doc.metadata.get("company_name", "Unknown") for doc in documents])),
+            "quarters": list(set([f"{doc.metadata.get('year', 'Unknown')} {doc.metadata.get('quarter', 'Unknown')}" for doc in documents]))
+        }
+    
+    def _fetch_company_documents(self, company_name: str, vector_store) -> List[Document]:
         # Search for documents from the company, focusing on risk-related content
         documents = vector_store.search_by_company(company_name, "risk factors disclosure", k=10)
         
         if not documents:
-            # Try broader search if no risk-specific documents found
-            documents = vector_store.search_by_company(company_name, "financial performance", k=10)
+            # Subset search is only empty if the company has no chunks or the query
+            # could not be embedded; fall back to the company's chunks without embedding
+            documents = vector_store.get_docs_by_filter("company", company_name, limit=10)
+        
+        return documents
+    
+    def analyze_company_risks(self, company_name: str, vector_store,
+                              on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+        """Analyze risks for a specific company."""
+        documents = self._fetch_company_documents(company_name, vector_store)
         
         if not documents:
             return {"error": f"No documents found for company: {company_name}"}
         
-        return self.analyze_risks(documents)
+        return self.analyze_risks(documents, on_token)
+    
+    async def analyze_portfolio_risks(self, companies: List[str], vector_store,
+                                      max_concurrency: int = constants.LLM_MAX_CONCURRENCY) -> Dict[str, Dict[str, Any]]:
+        """Analyze risks for several companies at once, keyed by company.
+        
+        Retrieval is local and shares cached query embeddings, so only the
+        model calls are awaited; they overlap up to max_concurrency at a time.
+        """
+        companies = list(dict.fromkeys(companies))  # One call per company, even if listed twice
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def company_risks(company_name: str) -> Dict[str, Any]:
+            documents = self._fetch_company_documents(company_name, vector_store)
+            if not documents:
+                return {"error": f"No documents found for company: {company_name}"}
+            async with semaphore:
+                return await self.aanalyze_risks(documents)
+        
+        results = await asyncio.gather(*(company_risks(company) for company in companies))
+        return dict(zip(companies, results))
     
-    def analyze_quarter_risks(self, year: str, quarter: str, vector_store) -> Dict[str, Any]:
+    def analyze_quarter_risks(self, year: str, quarter: str, vector_store,
+                              on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Analyze risks for a specific quarter."""
         # Search for documents from the quarter, focusing on risk-related content
         documents = vector_store.search_by_quarter(year, quarter, "risk factors", k=10)
         
         if not documents:
-            # Try broader search if no risk-specific documents found
-            documents = vector_store.search_by_quarter(year, quarter, "financial performance", k=10)
+            # As for companies: fall back to the quarter's chunks without embedding
+            documents = vector_store.get_docs_by_filter("quarter", (year, quarter), limit=10)
         
         if not documents:
             return {"error": f"No documents found for {year} {quarter}"}
         
-        return self.analyze_risks(documents)
+        return self.analyze_risks(documents, on_token)
     
-    def analyze_section_risks(self, section: str, vector_store) -> Dict[str, Any]:
+    def analyze_section_risks(self, section: str, vector_store,
+                              on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
         """Analyze risks from a specific section (e.g., risk factors section)."""
         # Search for documents from the specific section
         documents = vector_store.search_by_section(section, "risk disclosure", k=10)
@@ -101,46 +175,12 @@ Format your response in a professional, analytical tone suitable for risk assess
         if not documents:
             return {"error": f"No documents found for section: {section}"}
         
-        return self.analyze_risks(documents)
-    
-    def _prepare_context(self, documents: List[Document]) -> str:
-        """Prepare context from documents for risk analysis."""
-        context_parts = []
-        
-        for i, doc in enumerate(documents):
-            company = doc.metadata.get("company_name", "Unknown")
-            year = doc.metadata.get("year", "Unknown")
-            quarter = doc.metadata.get("quarter", "Unknown")
-            section = doc.metadata.get("section", "Unknown")
-            
-            header = f"Document {i+1}: {company} - {year} {quarter} - {section}"
-            content = doc.page_content[:1000]  # Limit content length
-            
-            context_parts.append(f"{header}\n{content}\n")
-        
-        return "\n".join(context_parts)
+        return self.analyze_risks(documents, on_token)
     
     def identify_risk_keywords(self, text: str) -> List[str]:
         """Identify risk-related keywords in text."""
-        risk_keywords = [
-            "risk", "uncertainty", "volatility", "exposure", "vulnerability",
-            "threat", "challenge", "adverse", "negative", "decline", "loss",
-            "litigation", "legal", "regulatory", "compliance", "penalty",
-            "cybersecurity", "data breach", "privacy", "security",
-            "supply chain", "disruption", "shortage", "inflation",
-            "interest rate", "currency", "exchange rate", "hedge",
-            "competition", "market share", "pricing pressure",
-            "technology", "innovation", "obsolescence", "disruption"
-        ]
-        
-        found_keywords = []
         text_lower = text.lower()
-        
-        for keyword in risk_keywords:
-            if keyword in text_lower:
-                found_keywords.append(keyword)
-        
-        return found_keywords
+        return [keyword for keyword in _RISK_KEYWORDS if keyword in text_lower]
 
 # Example usage
 if __name__ == "__main__":
@@ -1,57 +1,307 @@
 import os
-from typing import List, Dict, Any, Optional
+import json
+import logging
+import sqlite3
+import hashlib
+import threading
+from collections import defaultdict
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, Iterator, Tuple, Union
 from langchain.schema import Document
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_community.docstore.base import AddableMixin, Docstore
 from langchain_community.vectorstores import FAISS
+import faiss
+import numpy as np
 import constants
 
+logger = logging.getLogger(__name__)
+
+# Inverted indices from metadata to FAISS ids: index name -> key of a chunk's metadata
+_INDEXED_FIELDS = {
+    "company": lambda meta: meta.get("company_name"),
+    "quarter": lambda meta: (meta.get("year"), meta.get("quarter")),
+    "section": lambda meta: meta.get("section"),
+}
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+LEGACY_DOCSTORE_FILE = "index.pkl"  # Pickled docstore written by FAISS.save_local
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """LangChain docstore kept in a SQLite file, so documents are read only when needed.
+    
+    Rows are numbered by position, which matches the FAISS id LangChain gives
+    each document. Writes become durable when commit() is called, which
+    save() does together with writing the index.
+    """
+    
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "position INTEGER PRIMARY KEY, doc_id TEXT UNIQUE NOT NULL, "
+            "page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+    
+    def add(self, texts: Dict[str, Document]) -> None:
+        with self._lock:
+            start = self._conn.execute("SELECT COALESCE(MAX(position) + 1, 0) FROM documents").fetchone()[0]
+            self._conn.executemany(
+                "INSERT INTO documents VALUES (?, ?, ?, ?)",
+                [(start + offset, doc_id, doc.page_content, json.dumps(doc.metadata))
+                 for offset, (doc_id, doc) in enumerate(texts.items())]
+            )
+    
+    def delete(self, ids: List) -> None:
+        with self._lock:
+            self._conn.executemany("DELETE FROM documents WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+    
+    def search(self, search: str) -> Union[str, Document]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM documents WHERE doc_id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+    
+    def index_to_docstore_id(self) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, doc_id FROM documents"))
+    
+    def iter_documents(self) -> Iterator[Document]:
+        with self._lock:
+            rows = self._conn.execute("SELECT page_content, metadata FROM documents ORDER BY position").fetchall()
+        return (Document(page_content=text, metadata=json.loads(metadata)) for text, metadata in rows)
+    
+    def iter_metadata(self) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT position, metadata FROM documents").fetchall()
+        return ((position, json.loads(metadata)) for position, metadata in rows)
+    
+    def truncate(self, count: int) -> None:
+        """Drop rows past the first count, e.g. ones whose vectors never reached the saved index."""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE position >= ?", (count,))
+            self._conn.commit()
+    
+    def commit(self) -> None:
+        with self._lock:
+            self._conn.commit()
+
 class VectorStore:
-    def __init__(self, db_path: str = constants.VECTOR_DB_PATH):
+    def __init__(self, db_path: str = constants.VECTOR_DB_PATH, ef_search: int = constants.HNSW_EF_SEARCH):
         self.db_path = db_path
+        self.ef_search = ef_search
+        config = constants.load_config()
         self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=constants.EMBEDDING_MODEL,
-            google_api_key=constants.GOOGLE_API_KEY
+            model=config.embedding_model,
+            google_api_key=config.google_api_key
         )
+        # Queries such as "financial performance" repeat across analyses; embed each once
+        self.embed_query = lru_cache(maxsize=constants.QUERY_EMBEDDING_CACHE_SIZE)(self.embeddings.embed_query)
         self.vector_store = None
+        self._lock = threading.Lock()
+        self._content_hashes = None  # Built lazily from the docstore
+        self._metadata_index = None  # Built lazily from the docstore
+        self._periods = None  # Sorted (year, quarter) pairs; reset when documents are added
+        self.version = 0  # Bumped whenever documents are added
+        self._dirty = False  # Documents added since the last save
         self._load_or_create_store()
     
     def _load_or_create_store(self):
         """Load existing vector store or create new one."""
-        if os.path.exists(self.db_path):
+        index_path = os.path.join(self.db_path, INDEX_FILE)
+        if os.path.exists(os.path.join(self.db_path, DOCSTORE_FILE)) and os.path.exists(index_path):
             try:
-                self.vector_store = FAISS.load_local(
-                    self.db_path, 
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
+                index = faiss.read_index(index_path)
+                docstore = SQLiteDocstore(os.path.join(self.db_path, DOCSTORE_FILE))
+                docstore.truncate(index.ntotal)
+                self.vector_store = FAISS(
+                    embedding_function=self.embeddings,
+                    index=index,
+                    docstore=docstore,
+                    index_to_docstore_id=docstore.index_to_docstore_id()
                 )
-                print(f"Loaded existing vector store from {self.db_path}")
+                self._set_search_params()
+                logger.info("Loaded existing vector store from %s", self.db_path)
             except Exception as e:
-                print(f"Error loading vector store: {e}")
+                logger.error("Error loading vector store: %s", e)
+                self.vector_store = None
+        elif os.path.exists(os.path.join(self.db_path, LEGACY_DOCSTORE_FILE)):
+            try:
+                self._migrate_legacy_store()
+                self._set_search_params()
+                logger.info("Migrated vector store in %s to a SQLite docstore", self.db_path)
+            except Exception as e:
+                logger.error("Error loading vector store: %s", e)
                 self.vector_store = None
         else:
             self.vector_store = None
         
         if self.vector_store is None:
-            print(f"Vector store will be created when first documents are added")
+            logger.info("Vector store will be created when first documents are added")
+    
+    def _migrate_legacy_store(self):
+        """Move a store saved by FAISS.save_local onto a SQLite docstore, once."""
+        store = FAISS.load_local(self.db_path, self.embeddings, allow_dangerous_deserialization=True)
+        docstore = SQLiteDocstore(os.path.join(self.db_path, DOCSTORE_FILE))
+        docstore.truncate(0)
+        ids = [store.index_to_docstore_id[i] for i in range(len(store.index_to_docstore_id))]
+        docstore.add({doc_id: store.docstore.search(doc_id) for doc_id in ids})
+        docstore.commit()
+        store.docstore = docstore
+        self.vector_store = store
+        # The SQLite rows now match the saved index, so the pickle is no longer needed
+        os.remove(os.path.join(self.db_path, LEGACY_DOCSTORE_FILE))
 
+    def _create_store(self, text_embeddings, metadatas) -> FAISS:
+        """Create a FAISS store backed by an HNSW index instead of a flat scan.
+        
+        Vectors are stored as 8-bit scalar-quantized codes, a quarter of the
+        memory of float32. The quantizer uses one range for all dimensions,
+        learned from the first batch and widened by SQ_RANGE_MARGIN, since
+        per-dimension ranges are unreliable from a small first batch.
+        """
+        vectors = np.array([embedding for _, embedding in text_embeddings], dtype="float32")
+        index = faiss.IndexHNSWSQ(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit_uniform, constants.HNSW_M)
+        index.hnsw.efConstruction = constants.HNSW_EF_CONSTRUCTION
+        faiss.downcast_index(index.storage).sq.rangestat_arg = constants.SQ_RANGE_MARGIN
+        index.train(vectors)
+        os.makedirs(self.db_path, exist_ok=True)
+        docstore = SQLiteDocstore(os.path.join(self.db_path, DOCSTORE_FILE))
+        docstore.truncate(0)
+        store = FAISS(
+            embedding_function=self.embeddings,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id={}
+        )
+        store.add_embeddings(text_embeddings, metadatas=metadatas)
+        self.vector_store = store
+        self._set_search_params()
+        return store
+    
+    def _set_search_params(self):
+        """Apply ef_search to the index; stores saved with a flat index have nothing to tune."""
+        hnsw = getattr(self.vector_store.index, "hnsw", None)
+        if hnsw is not None:
+            hnsw.efSearch = self.ef_search
+    
     def add_documents(self,documents:List[Document])->int:
+        """Embed documents and add them to the store; call flush() to persist them."""
         if not documents:
-            print("No documents to add")
+            logger.debug("No documents to add")
             return 0
-        if self.vector_store is None:
-            self.vector_store = FAISS.from_documents(documents, self.embeddings)
-            print(f"Created new vector store with {len(documents)} documents")
-        else:
-            self.vector_store.add_documents(documents)
-            print(f"Added {len(documents)} documents to existing vector store")
-        self.save()
+        count = self.add_documents_batch(documents)
+        logger.info("Added %d documents to vector store", count)
+        return count
+    
+    def add_documents_batch(self, documents: List[Document]) -> int:
+        """Embed a batch of documents and add them to the store without saving.
+        
+        Safe to call from several threads: the embedding requests run
+        concurrently and only the index update is serialized. Call save()
+        once all batches are added.
+        """
+        if not documents:
+            return 0
+        
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        text_embeddings = list(zip(texts, self._embed_documents(texts)))
+        
+        with self._lock:
+            if self.vector_store is None:
+                self._create_store(text_embeddings, metadatas)
+            else:
+                self.vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+            self._on_documents_added(documents)
         return len(documents)
     
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts, batch_size=constants.EMBEDDING_BATCH_SIZE)
+    
+    @staticmethod
+    def content_hash(document: Document) -> str:
+        """Hash identifying a chunk by its source file and text."""
+        source = document.metadata.get("source_file", "")
+        return hashlib.sha256(f"{source}\0{document.page_content}".encode("utf-8")).hexdigest()
+    
+    def filter_new_documents(self, documents: List[Document]) -> List[Document]:
+        """Drop documents already in the store or repeated within the list.
+        
+        Re-uploading a file therefore does not pay for embedding its chunks again.
+        """
+        with self._lock:
+            seen = set(self._get_content_hashes())
+        
+        new_documents = []
+        for doc in documents:
+            doc_hash = self.content_hash(doc)
+            if doc_hash in seen:
+                continue
+            seen.add(doc_hash)
+            new_documents.append(doc)
+        return new_documents
+    
+    def _iter_documents(self):
+        """Iterate over all documents held in the docstore."""
+        if not self.vector_store:
+            return iter(())
+        return self.vector_store.docstore.iter_documents()
+    
+    def _get_content_hashes(self) -> set:
+        if self._content_hashes is None:
+            self._content_hashes = {self.content_hash(doc) for doc in self._iter_documents()}
+        return self._content_hashes
+    
+    def _get_metadata_index(self) -> Dict[str, Dict[Any, List[int]]]:
+        if self._metadata_index is None:
+            self._metadata_index = {name: defaultdict(list) for name in _INDEXED_FIELDS}
+            if self.vector_store:
+                for faiss_id, metadata in self.vector_store.docstore.iter_metadata():
+                    self._index_metadata(faiss_id, metadata)
+        return self._metadata_index
+    
+    def _index_metadata(self, faiss_id: int, metadata: Dict[str, Any]):
+        for name, key in _INDEXED_FIELDS.items():
+            self._metadata_index[name][key(metadata)].append(faiss_id)
+    
+    def _on_documents_added(self, documents: List[Document]):
+        """Update derived state after documents are added (caller holds the lock or is single-threaded)."""
+        self.version += 1
+        self._dirty = True
+        self._periods = None
+        if self._content_hashes is not None:
+            self._content_hashes.update(self.content_hash(doc) for doc in documents)
+        if self._metadata_index is not None:
+            # FAISS assigns ids sequentially, so the new documents hold the last ids
+            first_id = self.vector_store.index.ntotal - len(documents)
+            for offset, doc in enumerate(documents):
+                self._index_metadata(first_id + offset, doc.metadata)
+    
     def save(self):
-        """Save the vector store to disk."""
+        """Save the vector store to disk.
+        
+        Docstore rows are committed before the index is replaced, so a crash in
+        between leaves extra rows, which loading drops, never vectors without rows.
+        """
         if self.vector_store:
-            self.vector_store.save_local(self.db_path)
-            print(f"Saved vector store to {self.db_path}")
+            index_path = os.path.join(self.db_path, INDEX_FILE)
+            with self._lock:
+                self.vector_store.docstore.commit()
+                faiss.write_index(self.vector_store.index, index_path + ".tmp")
+                os.replace(index_path + ".tmp", index_path)
+                self._dirty = False
+            logger.info("Saved vector store to %s", self.db_path)
+    
+    def flush(self):
+        """Save the store if documents were added since the last save."""
+        if self._dirty:
+            self.save()
     
     def similarity_search(self, query: str, k: int = 5) -> List[Document]:
         """Search for similar documents."""
@@ -59,54 +309,82 @@ class VectorStore:
             return []
         
         try:
-            return self.vector_store.similarity_search(query, k=k)
+            return self.vector_store.similarity_search_by_vector(self.embed_query(query), k=k)
         except Exception as e:
-            print(f"Error in similarity search: {e}")
+            logger.error("Error in similarity search: %s", e)
             return []
     
-    def search_by_company(self, company_name: str, query: str = "", k: int = 5) -> List[Document]:
-        """Search for documents from a specific company."""
+    def _search_subset(self, query: str, k: int, index_name: str, key, label: str) -> List[Document]:
+        """Similarity search over only the documents listed under key in a metadata index.
+        
+        The subset's vectors are scanned exactly through a FAISS ID selector
+        rather than walking the HNSW graph, which may not reach a small
+        subset, so every result comes from the requested slice of the store.
+        """
         if not self.vector_store:
             return []
         
         try:
-            # Combine company filter with query
-            search_query = f"company: {company_name}"
-            if query:
-                search_query += f" {query}"
+            with self._lock:
+                ids = list(self._get_metadata_index()[index_name].get(key, ()))
+            if not ids:
+                return []
+            
+            index = self.vector_store.index
+            if getattr(index, "hnsw", None) is not None:
+                index = faiss.downcast_index(index.storage)
+            query_vector = np.array([self.embed_query(query or "financial performance")], dtype="float32")
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(np.array(ids, dtype="int64")))
+            _, found = index.search(query_vector, min(k, len(ids)), params=params)
             
-            return self.vector_store.similarity_search(search_query, k=k)
+            docstore = self.vector_store.docstore
+            index_to_docstore_id = self.vector_store.index_to_docstore_id
+            return [docstore.search(index_to_docstore_id[i]) for i in found[0] if i != -1]
         except Exception as e:
-            print(f"Error in company search: {e}")
+            logger.error("Error in %s search: %s", label, e)
             return []
     
-    def search_by_quarter(self, year: str, quarter: str, query: str = "", k: int = 5) -> List[Document]:
-        """Search for documents from a specific quarter."""
+    def get_docs_by_filter(self, index_name: str, key, limit: int = 10) -> List[Document]:
+        """Documents listed under key in a metadata index, in insertion order.
+        
+        A pure metadata lookup with no embedding call, for when a similarity
+        search over the same slice returned nothing (e.g. the embedding request failed).
+        """
         if not self.vector_store:
             return []
         
         try:
-            # Combine quarter filter with query
-            search_query = f"quarter: {year} {quarter}"
-            if query:
-                search_query += f" {query}"
-            
-            return self.vector_store.similarity_search(search_query, k=k)
+            with self._lock:
+                ids = self._get_metadata_index()[index_name].get(key, [])[:limit]
+            docstore = self.vector_store.docstore
+            index_to_docstore_id = self.vector_store.index_to_docstore_id
+            return [docstore.search(index_to_docstore_id[i]) for i in ids]
         except Exception as e:
-            print(f"Error in quarter search: {e}")
+            logger.error("Error in %s lookup: %s", index_name, e)
             return []
     
+    def search_by_company(self, company_name: str, query: str = "", k: int = 5) -> List[Document]:
+        """Search for documents from a specific company."""
+        return self._search_subset(query, k, "company", company_name, "company")
+    
+    def search_by_quarter(self, year: str, quarter: str, query: str = "", k: int = 5) -> List[Document]:
+        """Search for documents from a specific quarter."""
+        return self._search_subset(query, k, "quarter", (year, quarter), "quarter")
+    
+    def search_by_section(self, section: str, query: str = "", k: int = 5) -> List[Document]:
+        """Search for documents from a specific section (e.g. "risk_factors")."""
+        return self._search_subset(query, k, "section", section, "section")
+    
     def get_all_companies(self) -> List[str]:
         """Get list of all companies in the store."""
         if not self.vector_store:
             return []
         
         try:
-            # This would need to be implemented based on your metadata structure
-            # For now, return empty list
-            return []
+            with self._lock:
+                return sorted(company for company in self._get_metadata_index()["company"] if company)
         except Exception as e:
-            print(f"Error getting companies: {e}")
+            logger.error("Error getting companies: %s", e)
             return []
     
     def get_all_quarters(self) -> List[Dict[str, str]]:
@@ -115,11 +393,17 @@ class VectorStore:
             return []
         
         try:
-            # This would need to be implemented based on your metadata structure
-            # For now, return empty list
-            return []
+            with self._lock:
+                if self._periods is None:
+                    # Files whose name gave no year or quarter are indexed under "Unknown"
+                    self._periods = sorted(
+                        period for period in self._get_metadata_index()["quarter"]
+                        if all(period) and "Unknown" not in period
+                    )
+                periods = self._periods
+            return [{"year": year, "quarter": quarter} for year, quarter in periods]
         except Exception as e:
-            print(f"Error getting quarters: {e}")
+            logger.error("Error getting quarters: %s", e)
             return []
     
     def get_store_stats(self) -> Dict[str, Any]:
@@ -128,10 +412,13 @@ class VectorStore:
             return {"total_documents": 0}
         
         try:
-            # This would need to be implemented based on your store structure
-            return {"total_documents": "Unknown"}
+            return {
+                "total_documents": self.vector_store.index.ntotal,
+                "companies": self.get_all_companies(),
+                "quarters": self.get_all_quarters()
+            }
         except Exception as e:
-            print(f"Error getting store stats: {e}")
+            logger.error("Error getting store stats: %s", e)
             return {"total_documents": 0}
 
 # Example usage